@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pcroutines.settings')
+# Lo lee settings: bajo ASGI las conexiones persistentes quedan desactivadas por defecto
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
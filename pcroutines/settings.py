@@ -24,6 +24,59 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '').split(',')
 # URLS DE OTROS MS
 USERS_SERVICE_URL = os.getenv('USERS_SERVICE_URL')
 EXERCISES_SERVICE_URL = os.getenv('EXERCISES_SERVICE_URL')
+# Credencial de servicio con que los workers de jobs llaman al MS de Ejercicios
+EXERCISES_SERVICE_TOKEN = os.getenv('EXERCISES_SERVICE_TOKEN', '')
+
+# Clientes HTTP hacia los otros MS: pool keep-alive por servicio, timeouts
+# (segundos), reintentos con backoff aleatorio y circuit breaker.
+# El pool de Usuarios se dimensiona con los hilos de gunicorn y el de
+# Ejercicios con los hilos que lo consultan en paralelo.
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '1'))
+SERVICE_CONNECT_TIMEOUT = float(os.getenv('SERVICE_CONNECT_TIMEOUT', '3.05'))
+USERS_SERVICE_READ_TIMEOUT = float(os.getenv('USERS_SERVICE_READ_TIMEOUT', '10'))
+EXERCISES_SERVICE_READ_TIMEOUT = float(os.getenv('EXERCISES_SERVICE_READ_TIMEOUT', '50'))
+SERVICE_RETRIES = int(os.getenv('SERVICE_RETRIES', '2'))
+SERVICE_BACKOFF = float(os.getenv('SERVICE_BACKOFF', '0.2'))
+SERVICE_BACKOFF_JITTER = float(os.getenv('SERVICE_BACKOFF_JITTER', '0.3'))
+CIRCUIT_BREAKER_FAILURES = int(os.getenv('CIRCUIT_BREAKER_FAILURES', '5'))
+CIRCUIT_BREAKER_RESET = float(os.getenv('CIRCUIT_BREAKER_RESET', '30'))
+
+# Obtención concurrente de ejercicios (hilos del pool y presupuesto total en segundos)
+EXERCISES_FETCH_WORKERS = int(os.getenv('EXERCISES_FETCH_WORKERS', '10'))
+EXERCISES_FETCH_DEADLINE = float(os.getenv('EXERCISES_FETCH_DEADLINE', '60'))
+
+USERS_SERVICE_POOL_SIZE = int(os.getenv('USERS_SERVICE_POOL_SIZE', GUNICORN_THREADS))
+EXERCISES_SERVICE_POOL_SIZE = int(os.getenv('EXERCISES_SERVICE_POOL_SIZE', EXERCISES_FETCH_WORKERS))
+
+# Ids de usuario (JWT) que pueden usar /routines/generate/batch/, separados por coma
+ROUTINES_BATCH_OPERATOR_IDS = [int(i) for i in os.getenv('ROUTINES_BATCH_OPERATOR_IDS', '').split(',') if i]
+
+# Segundos tras los cuales un job en proceso se considera abandonado y se reintenta
+ROUTINE_JOB_STALE_SECONDS = int(os.getenv('ROUTINE_JOB_STALE_SECONDS', '600'))
+
+# Pool de rutinas pre-generadas por (objetivo, experiencia): variantes por perfil,
+# segundos tras los que se reemplazan y segundos que se cachean en memoria
+ROUTINE_TEMPLATES_PER_PROFILE = int(os.getenv('ROUTINE_TEMPLATES_PER_PROFILE', '20'))
+ROUTINE_TEMPLATE_MAX_AGE = int(os.getenv('ROUTINE_TEMPLATE_MAX_AGE', '86400'))
+ROUTINE_TEMPLATE_CACHE_TTL = int(os.getenv('ROUTINE_TEMPLATE_CACHE_TTL', '300'))
+
+# Días tras los que archive_routines saca una rutina de las tablas calientes
+ROUTINE_ARCHIVE_AFTER_DAYS = int(os.getenv('ROUTINE_ARCHIVE_AFTER_DAYS', '180'))
+
+# Segundos durante los que se recuerda la respuesta de un Idempotency-Key
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+
+# Catálogo local de ejercicios (segundos de vigencia, ventana stale y entradas máximas).
+# EXERCISE_CATALOG_SHARED_CACHE: alias de CACHES para compartirlo entre procesos.
+# EXERCISE_CATALOG_FAILURE_BACKOFF: segundos sin reintentar la descarga tras un fallo.
+EXERCISE_CATALOG_TTL = int(os.getenv('EXERCISE_CATALOG_TTL', '300'))
+EXERCISE_CATALOG_STALE_TTL = int(os.getenv('EXERCISE_CATALOG_STALE_TTL', '600'))
+EXERCISE_CATALOG_MAX_ENTRIES = int(os.getenv('EXERCISE_CATALOG_MAX_ENTRIES', '256'))
+EXERCISE_CATALOG_SHARED_CACHE = os.getenv('EXERCISE_CATALOG_SHARED_CACHE') or None
+EXERCISE_CATALOG_FAILURE_BACKOFF = int(os.getenv('EXERCISE_CATALOG_FAILURE_BACKOFF', '30'))
+
+# IPs que pueden leer /metrics (formato Prometheus), separadas por coma
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
 
 # Application definition
 
@@ -52,6 +105,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'routines.middleware.metrics_middleware',
 ]
 
 ROOT_URLCONF = 'pcroutines.urls'
@@ -77,17 +131,93 @@ WSGI_APPLICATION = 'pcroutines.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DB_ENGINE permite p. ej. correr los benchmarks sobre SQLite (django.db.backends.sqlite3)
+# Las conexiones persistentes (DB_CONN_MAX_AGE) son por hilo: bajo ASGI (asgi.py fija
+# DJANGO_ASGI) cada hilo de sync_to_async se quedaría con la suya, así que ahí el
+# valor por defecto es 0 y para reutilizar conexiones se usa DB_POOL.
+ASGI = os.getenv("DJANGO_ASGI", "0") == "1"
 DATABASES = {
     'default': {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": os.getenv("DB_ENGINE", "django.db.backends.postgresql"),
         "NAME": os.getenv("DB_NAME"),
         "USER": os.getenv("DB_USER"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "0" if ASGI else "60")),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "1") == "1",
     }
 }
 
+# Con DB_POOL=1 cada worker usa un pool de psycopg 3 (requiere psycopg[pool]) en
+# lugar de conexiones persistentes. Por defecto tiene una conexión por hilo de
+# gunicorn, acotado para que WEB_CONCURRENCY workers no pasen de DB_MAX_CONNECTIONS.
+# Es el modo a usar bajo ASGI para reutilizar conexiones.
+DB_POOL = os.getenv("DB_POOL", "0") == "1"
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", max(1, min(GUNICORN_THREADS, DB_MAX_CONNECTIONS // WEB_CONCURRENCY))))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", DB_POOL_MAX_SIZE))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+if DB_POOL and DATABASES['default']['ENGINE'] == "django.db.backends.postgresql":
+    # El pool ya reutiliza y valida las conexiones: Django exige CONN_MAX_AGE=0
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        "pool": {
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": DB_POOL_TIMEOUT,
+        },
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'pcroutines'),
+    }
+}
+
+# Segundos que se cachea la rutina activa de cada usuario (0 desactiva la caché).
+# Con la caché local (LocMemCache) se acota a ACTIVE_ROUTINE_LOCAL_CACHE_TTL: las
+# rutinas que generan otros procesos no se escriben en ella. Usar una caché
+# compartida (CACHE_BACKEND) para aprovechar el TTL largo.
+ACTIVE_ROUTINE_CACHE_TTL = int(os.getenv('ACTIVE_ROUTINE_CACHE_TTL', '3600'))
+ACTIVE_ROUTINE_LOCAL_CACHE_TTL = int(os.getenv('ACTIVE_ROUTINE_LOCAL_CACHE_TTL', '5'))
+
+# Segundos que se cachea el perfil (experiencia/objetivo) de cada usuario
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '60'))
+
+
+# Logging
+# https://docs.djangoproject.com/en/6.0/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'routines': {
+            'handlers': ['console'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -123,6 +253,9 @@ SIMPLE_JWT = {
     'SIGNING_KEY': os.getenv('SECRET_KEY'),
 }
 
+# Tokens ya verificados que se recuerdan (hasta su exp) para no volver a validar la firma
+JWT_CACHE_MAX_ENTRIES = int(os.getenv('JWT_CACHE_MAX_ENTRIES', '10000'))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
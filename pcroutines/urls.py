@@ -1,5 +1,7 @@
 from django.urls import path, include
+from routines.views import metrics
 
 urlpatterns = [
     path('routines/', include('routines.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RoutinesConfig(AppConfig):
     name = 'routines'
+
+    def ready(self):
+        from . import signals  # noqa: F401
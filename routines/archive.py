@@ -0,0 +1,87 @@
+import time
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Rutina, RutinaArchivada, RutinaSnapshot
+from .snapshots import nuevo_snapshot, proyeccion_rutina
+
+
+def rutinas_archivables(antes_de):
+    """
+    Rutinas creadas antes de `antes_de` que no son la última de su usuario
+    (esa la sigue necesitando CheckRoutineView). El corte por fecha usa el
+    índice (created_at, id) y la búsqueda de una más nueva el
+    (user_id, -created_at, -id).
+    """
+    mas_nueva = Rutina.objects.filter(user_id=OuterRef("user_id")).filter(
+        Q(created_at__gt=OuterRef("created_at"))
+        | Q(created_at=OuterRef("created_at"), id__gt=OuterRef("id"))
+    )
+    return Rutina.objects.filter(created_at__lt=antes_de).filter(Exists(mas_nueva))
+
+
+def _documentos(ids):
+    """
+    [RutinaArchivada] de las rutinas `ids` a partir de sus snapshots; las que
+    no tienen (anteriores a los snapshots) se renderizan en el momento.
+    """
+    archivadas = [
+        RutinaArchivada(
+            rutina_id=rutina_id, user_id=user_id, created_at=created_at,
+            detalle=detalle, por_dias=por_dias, etag=etag,
+        )
+        for rutina_id, user_id, created_at, detalle, por_dias, etag in (
+            RutinaSnapshot.objects
+            .filter(rutina_id__in=ids)
+            .values_list("rutina_id", "rutina__user_id", "rutina__created_at", "detalle", "por_dias", "etag")
+        )
+    ]
+    sin_snapshot = set(ids) - {a.rutina_id for a in archivadas}
+    for rutina in Rutina.objects.filter(id__in=sin_snapshot):
+        snapshot = nuevo_snapshot(*proyeccion_rutina(rutina.id, rutina.user_id))
+        archivadas.append(RutinaArchivada(
+            rutina_id=rutina.id, user_id=rutina.user_id, created_at=rutina.created_at,
+            detalle=snapshot.detalle, por_dias=snapshot.por_dias, etag=snapshot.etag,
+        ))
+    return archivadas
+
+
+def archivar_rutinas(antes_de, chunk_size=500, pausa=0.0, archivar=True, max_lotes=None):
+    """
+    Saca de las tablas calientes las rutinas de rutinas_archivables() en
+    lotes de `chunk_size`, cada uno en su propia transacción corta (copia a
+    RutinaArchivada si `archivar` y borra rutina, días, ejercicios y snapshot),
+    durmiendo `pausa` segundos entre lotes para no saturar la DB.
+    Genera el número de rutinas procesadas en cada lote.
+
+    Cada lote sigue desde la última fila del anterior por el índice
+    (created_at, id), así no se vuelven a leer las que no se archivan.
+    """
+    lotes = 0
+    ultima = None
+    while max_lotes is None or lotes < max_lotes:
+        pendientes = rutinas_archivables(antes_de)
+        if ultima is not None:
+            creada, rutina_id = ultima
+            pendientes = pendientes.filter(Q(created_at__gt=creada) | Q(created_at=creada, id__gt=rutina_id))
+        with transaction.atomic():
+            filas = list(
+                pendientes
+                .order_by("created_at", "id")
+                .select_for_update(skip_locked=True)
+                .values_list("created_at", "id")[:chunk_size]
+            )
+            if not filas:
+                return
+            ultima = filas[-1]
+            ids = [rutina_id for _, rutina_id in filas]
+            if archivar:
+                RutinaArchivada.objects.bulk_create(_documentos(ids), ignore_conflicts=True)
+            # El borrado en cascada se hace por lotes de pk, acotado al chunk
+            Rutina.objects.filter(id__in=ids).delete()
+
+        lotes += 1
+        yield len(ids)
+        if pausa:
+            time.sleep(pausa)
@@ -1,28 +1,113 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken
-from django.contrib.auth.models import AbstractBaseUser
 
 
-class MicroserviceUser(AbstractBaseUser):
-    USERNAME_FIELD = "id"
+class MicroserviceUser:
+    """
+    Usuario del MS de Usuarios tal como llega en el JWT. No es un modelo:
+    solo lo que DRF y las vistas necesitan (id y estado de autenticación).
+    """
+    __slots__ = ("id", "username")
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
 
     def __init__(self, user_id):
-        super().__init__()
         self.id = int(user_id)
         self.username = f"user_{user_id}"
 
     @property
-    def is_authenticated(self):
-        return True
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.username
+
+    def __eq__(self, other):
+        return isinstance(other, MicroserviceUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class TokensVerificados:
+    """
+    LRU de tokens ya verificados, indexados por su SHA-256. Cada entrada vale
+    hasta el `exp` del token, así que un token vencido nunca se acepta.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # hash -> (exp, user, validated_token)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def clave(raw_token):
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, clave):
+        with self._lock:
+            entry = self._entries.get(clave)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[clave]
+                return None
+            self._entries.move_to_end(clave)
+            return entry[1], entry[2]
+
+    def set(self, clave, exp, user, validated_token):
+        with self._lock:
+            self._entries[clave] = (exp, user, validated_token)
+            self._entries.move_to_end(clave)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+tokens_verificados = TokensVerificados(getattr(settings, "JWT_CACHE_MAX_ENTRIES", 10_000))
 
 
 class MicroserviceJWTAuthentication(JWTAuthentication):
     """
     Valida el token y devuelve un MicroserviceUser que DRF considerará autenticado.
     No intenta cargar el usuario desde la DB local.
+
+    Los tokens válidos se recuerdan (por hash) hasta su `exp`: las lecturas
+    que repiten token no vuelven a verificar la firma.
     """
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        clave = tokens_verificados.clave(raw_token)
+        cacheado = tokens_verificados.get(clave)
+        if cacheado is not None:
+            return cacheado
+
+        validated_token = self.get_validated_token(raw_token)
+        user = self.get_user(validated_token)
+        exp = validated_token.get("exp")
+        if exp:
+            tokens_verificados.set(clave, exp, user, validated_token)
+        return user, validated_token
+
     def get_user(self, validated_token):
         user_id = validated_token.get("user_id") or validated_token.get("user") or validated_token.get("sub")
         if user_id is None:
             raise InvalidToken("user_id no encontrado en el token")
-        return MicroserviceUser(user_id)
\ No newline at end of file
+        return MicroserviceUser(user_id)
@@ -0,0 +1,144 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+MUSCULOS = {
+    "pierna": "Pierna",
+    "pecho": "Pecho",
+    "espalda": "Espalda",
+    "brazos": "Brazos",
+    "cuerpo_completo": "Cuerpo Completo",
+}
+DIFICULTADES = {
+    "principiante": "Principiante",
+    "intermedio": "Intermedio",
+    "avanzado": "Avanzado",
+}
+OBJETIVOS = ["ganar_musculo", "perder_peso", "tonificar", "mantener_forma"]
+EQUIPOS = ["Mancuernas", "Barra", "Máquina", "Peso corporal", "Polea", "Kettlebell"]
+
+
+def catalogo_falso(total, rng=random):
+    """
+    Catálogo con la forma de /exercises/all/ repartido entre todos los
+    músculos y dificultades del split.
+    """
+    musculos = list(MUSCULOS.items())
+    dificultades = list(DIFICULTADES.items())
+    catalogo = []
+    for i in range(total):
+        musculo, musculo_display = musculos[i % len(musculos)]
+        dificultad, dificultad_display = dificultades[(i // len(musculos)) % len(dificultades)]
+        catalogo.append({
+            "id": f"ex-{i}",
+            "name": f"Ejercicio {i}",
+            "muscle_group": musculo,
+            "muscle_group_display": musculo_display,
+            "difficulty": dificultad,
+            "difficulty_display": dificultad_display,
+            "equipment_display": rng.choice(EQUIPOS),
+            "image_url": None,
+        })
+    return catalogo
+
+
+class ServiciosFalsos:
+    """
+    MS de Usuarios y de Ejercicios falsos en un servidor HTTP local (un hilo
+    por conexión). Responden `users/profile/`, `exercises/all/` y
+    `exercises/muscle-group/` con `latencia` segundos de espera y un 503 con
+    probabilidad `tasa_fallos`. Los dos servicios comparten `url`.
+
+        with ServiciosFalsos(latencia=0.02, catalogo=2000) as servicios:
+            override_settings(USERS_SERVICE_URL=servicios.url, ...)
+    """
+
+    def __init__(self, latencia=0.0, tasa_fallos=0.0, catalogo=500, seed=0):
+        self.latencia = latencia
+        self.tasa_fallos = tasa_fallos
+        self.peticiones = Counter()  # path -> llamadas recibidas
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._catalogo = catalogo_falso(catalogo, self._rng)
+        self._por_musculo = {}
+        for item in self._catalogo:
+            self._por_musculo.setdefault(item["muscle_group"], []).append(item)
+        self._server = None
+        self.url = None
+
+    def perfil(self):
+        with self._lock:
+            return {
+                "experience": self._rng.choice(list(DIFICULTADES)),
+                "goal": self._rng.choice(OBJETIVOS),
+            }
+
+    def _falla(self):
+        if not self.tasa_fallos:
+            return False
+        with self._lock:
+            return self._rng.random() < self.tasa_fallos
+
+    def responder(self, path, query):
+        """
+        (status, cuerpo) para una petición GET.
+        """
+        with self._lock:
+            self.peticiones[path] += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self._falla():
+            return 503, {"detail": "no disponible"}
+
+        if path == "/users/profile/":
+            return 200, {"user": self.perfil()}
+        if path == "/exercises/all/":
+            return 200, self._catalogo
+        if path == "/exercises/muscle-group/":
+            musculo = query.get("muscle_group", [""])[0]
+            return 200, self._por_musculo.get(musculo, [])
+        return 404, {"detail": "no encontrado"}
+
+    def start(self):
+        servicios = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como los MS reales
+
+            def do_GET(self):
+                partes = urlsplit(self.path)
+                status, cuerpo = servicios.responder(partes.path, parse_qs(partes.query))
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                try:
+                    self.wfile.write(datos)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # el cliente se cansó de esperar (timeout de lectura)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}/"
+        threading.Thread(target=self._server.serve_forever, name="servicios-falsos", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
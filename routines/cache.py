@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .concurrency import SingleFlight, AsyncSingleFlight
+
+# Se guarda "" cuando el usuario no tiene rutinas, para distinguirlo de un miss
+SIN_RUTINA = ""
+
+
+def _clave_rutina_activa(user_id):
+    return f"rutina_activa:{user_id}"
+
+
+def _ttl_rutina_activa():
+    """
+    Con la caché local de cada proceso la escritura directa no llega a los
+    demás (otros workers, jobs, generate_routines), así que ahí el TTL se
+    acota a ACTIVE_ROUTINE_LOCAL_CACHE_TTL.
+    """
+    ttl = getattr(settings, "ACTIVE_ROUTINE_CACHE_TTL", 3600)
+    if isinstance(caches["default"], LocMemCache):
+        ttl = min(ttl, getattr(settings, "ACTIVE_ROUTINE_LOCAL_CACHE_TTL", 5))
+    return ttl
+
+
+def obtener_rutina_activa(user_id, cargar):
+    """
+    Id (str) de la rutina más reciente del usuario o None.
+    `cargar()` solo se llama en un miss y su resultado queda en caché, salvo
+    que mientras tanto una escritura directa haya fijado uno más nuevo.
+    """
+    ttl = _ttl_rutina_activa()
+    if not ttl:
+        return cargar()
+
+    clave = _clave_rutina_activa(user_id)
+    rutina_id = cache.get(clave)
+    if rutina_id is None:
+        rutina_id = cargar()
+        cache.add(clave, rutina_id or SIN_RUTINA, ttl)
+    return rutina_id or None
+
+
+def fijar_rutina_activa(user_id, rutina_id):
+    ttl = _ttl_rutina_activa()
+    if ttl:
+        cache.set(_clave_rutina_activa(user_id), str(rutina_id), ttl)
+
+
+def invalidar_rutina_activa(user_id):
+    cache.delete(_clave_rutina_activa(user_id))
+
+
+_perfiles_en_vuelo = SingleFlight()
+_perfiles_en_vuelo_async = AsyncSingleFlight()
+
+
+def _clave_perfil(user_id):
+    return f"perfil:{user_id}"
+
+
+def obtener_perfil(user_id, cargar):
+    """
+    Perfil del usuario (MS Usuarios) cacheado por unos segundos.
+    Si varias peticiones del mismo usuario fallan la caché a la vez, solo
+    una llama a `cargar()` y el resto espera su resultado.
+    """
+    ttl = getattr(settings, "PROFILE_CACHE_TTL", 60)
+    if not ttl:
+        return cargar()
+
+    clave = _clave_perfil(user_id)
+    perfil = cache.get(clave)
+    if perfil is not None:
+        return perfil
+
+    def cargar_y_guardar():
+        perfil = cargar()
+        cache.set(clave, perfil, ttl)
+        return perfil
+
+    return _perfiles_en_vuelo.do(clave, cargar_y_guardar)
+
+
+async def aobtener_perfil(user_id, cargar):
+    """
+    Versión async de obtener_perfil; `cargar` es una corrutina.
+    """
+    ttl = getattr(settings, "PROFILE_CACHE_TTL", 60)
+    if not ttl:
+        return await cargar()
+
+    clave = _clave_perfil(user_id)
+    perfil = await cache.aget(clave)
+    if perfil is not None:
+        return perfil
+
+    async def cargar_y_guardar():
+        perfil = await cargar()
+        await cache.aset(clave, perfil, ttl)
+        return perfil
+
+    return await _perfiles_en_vuelo_async.do(clave, cargar_y_guardar)
+
+
+def invalidar_perfil(user_id):
+    cache.delete(_clave_perfil(user_id))
+
+
+def _clave_plantillas(goal, experience):
+    return f"plantillas:{goal}:{experience}"
+
+
+def obtener_plantillas(goal, experience, cargar):
+    """
+    Contenidos de las plantillas de un perfil ([] si no hay), cacheados por
+    unos segundos para que la generación no consulte la DB.
+    """
+    ttl = getattr(settings, "ROUTINE_TEMPLATE_CACHE_TTL", 300)
+    if not ttl:
+        return cargar()
+
+    clave = _clave_plantillas(goal, experience)
+    plantillas = cache.get(clave)
+    if plantillas is None:
+        plantillas = cargar()
+        cache.set(clave, plantillas, ttl)
+    return plantillas
+
+
+def invalidar_plantillas(perfiles):
+    cache.delete_many([_clave_plantillas(goal, experience) for goal, experience in perfiles])
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class ExerciseCatalog:
+    """
+    Catálogo local de ejercicios indexado por (músculo, dificultad) normalizados.
+
+    Se carga completo de una sola vez con `loader(token, timeout)` y cada
+    entrada del índice vive `ttl` segundos; pasado ese tiempo se sigue
+    sirviendo durante `stale_ttl` segundos más mientras un hilo en segundo
+    plano la refresca (stale-while-revalidate). El número de entradas está
+    acotado por `max_entries` y se expulsan las menos usadas (LRU).
+
+    Con `shared_cache` las entradas también se publican en esa caché de
+    Django para que otros procesos no tengan que descargar el catálogo.
+
+    Si una carga falla no se reintenta durante `failure_backoff` segundos:
+    mientras el MS no responde, quien llama pasa directo a su alternativa.
+    """
+
+    def __init__(self, loader, keys, ttl=300, stale_ttl=600, max_entries=256, shared_cache=None,
+                 failure_backoff=30):
+        self.loader = loader
+        self.keys = keys
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.shared_cache = shared_cache
+        self.failure_backoff = failure_backoff
+
+        self._entries = OrderedDict()  # clave -> (cargado_en, items)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._failed_at = None
+        self._cargas = 0  # cargas terminadas (bien o mal)
+        self._refreshing = False
+
+    # Lectura
+    def get(self, muscle_group, difficulty, token=None):
+        """
+        Devuelve una copia de los ejercicios indexados o None si no hay
+        entrada utilizable. Si la entrada está vencida pero aún dentro de la
+        ventana stale, la devuelve y lanza un refresco en segundo plano.
+        """
+        key = (muscle_group, difficulty or "")
+        entry = self._get_local(key) or self._get_shared(key)
+        if entry is None:
+            return None
+
+        loaded_at, items = entry
+        age = time.time() - loaded_at
+        if age > self.ttl + self.stale_ttl:
+            return None
+        if age > self.ttl and token:
+            self.refresh_async(token)
+        return list(items)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _get_shared(self, key):
+        if self.shared_cache is None:
+            return None
+        entry = caches[self.shared_cache].get(self._shared_key(key))
+        if entry is not None:
+            self._store({key: entry})
+        return entry
+
+    # Carga
+    def vigente(self):
+        return self._loaded_at is not None and time.time() - self._loaded_at < self.ttl
+
+    def fallo_reciente(self):
+        return self._failed_at is not None and time.time() - self._failed_at < self.failure_backoff
+
+    def ensure_loaded(self, token, timeout=None):
+        """
+        Carga el catálogo si no hay una carga vigente ni un fallo reciente.
+        Las llamadas concurrentes esperan a la carga en curso (como mucho
+        `timeout` segundos) y se quedan con su resultado en vez de repetirla.
+        """
+        if self.vigente():
+            return True
+        if self.fallo_reciente():
+            return False
+
+        cargas = self._cargas
+        if not self._load_lock.acquire(timeout=-1 if timeout is None else timeout):
+            return False
+        try:
+            if self._cargas != cargas:
+                # Otra carga terminó mientras se esperaba el lock
+                return self.vigente()
+            return self.load(token, timeout) is not None
+        finally:
+            self._load_lock.release()
+
+    def load(self, token, timeout=None):
+        """
+        Descarga el catálogo completo y reemplaza el índice.
+        Devuelve el índice construido ({clave: [items]}) o None si falló.
+        """
+        index = None
+        try:
+            items = self.loader(token, timeout)
+            if items is not None:
+                index = self.indexar(items)
+            return index
+        finally:
+            if index is None:
+                self.registrar_fallo()
+            self._cargas += 1
+
+    def registrar_fallo(self):
+        """
+        Anota una carga fallida (también las del cliente async) para no
+        reintentarla hasta que pase `failure_backoff`.
+        """
+        self._failed_at = time.time()
+
+    def indexar(self, items):
+        """
+        Reemplaza el índice con un catálogo ya descargado (p. ej. por el cliente
+        async). `items` puede ser un iterador: se recorre una sola vez y cada
+        ejercicio se reparte en todos sus grupos en esa misma pasada.
+        """
+        loaded_at = time.time()
+        index = {}
+        for item in items:
+            for key in self.keys(item):
+                index.setdefault(key, []).append(item)
+
+        entries = {key: (loaded_at, group) for key, group in index.items()}
+        self._store(entries)
+        # Solo tras recorrer todo el stream: si se corta, la carga no cuenta como vigente
+        self._loaded_at = loaded_at
+        self._failed_at = None
+        if self.shared_cache is not None:
+            caches[self.shared_cache].set_many(
+                {self._shared_key(k): v for k, v in entries.items()},
+                timeout=self.ttl + self.stale_ttl,
+            )
+        return index
+
+    def refresh_async(self, token):
+        with self._lock:
+            if self._refreshing or self.fallo_reciente():
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.load(token)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="exercise-catalog-refresh", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded_at = None
+            self._failed_at = None
+
+    def _store(self, entries):
+        with self._lock:
+            for key, entry in entries.items():
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _shared_key(key):
+        return "exercise_catalog:%s:%s" % key
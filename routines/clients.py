@@ -0,0 +1,318 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class CircuitoAbierto(Exception):
+    """
+    El servicio acumuló demasiados fallos seguidos y no se intenta la llamada.
+    """
+    def __init__(self, servicio):
+        self.servicio = servicio
+        super().__init__(f"El servicio {servicio} no está disponible, intenta más tarde")
+
+
+class CircuitBreaker:
+    """
+    Tras `max_fallos` fallos consecutivos el circuito se abre y las llamadas
+    fallan de inmediato durante `reset_timeout` segundos. Pasado ese tiempo
+    se deja pasar una sola llamada de prueba (half-open): si responde bien
+    se cierra, si no vuelve a abrirse.
+    """
+
+    def __init__(self, nombre, max_fallos=5, reset_timeout=30):
+        self.nombre = nombre
+        self.max_fallos = max_fallos
+        self.reset_timeout = reset_timeout
+        self._fallos = 0
+        self._abierto_desde = None
+        self._probando = False
+        self._lock = threading.Lock()
+
+    def antes_de_llamar(self):
+        """
+        Lanza CircuitoAbierto si no se puede llamar. Devuelve True si esta
+        llamada es la de prueba del half-open.
+        """
+        with self._lock:
+            if self._abierto_desde is None:
+                return False
+            if time.monotonic() - self._abierto_desde < self.reset_timeout or self._probando:
+                raise CircuitoAbierto(self.nombre)
+            self._probando = True
+            return True
+
+    def liberar_prueba(self):
+        """
+        La llamada de prueba terminó sin respuesta ni error del servicio (p. ej.
+        se canceló): deja pasar otra prueba sin contarlo como fallo.
+        """
+        with self._lock:
+            self._probando = False
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._probando = False
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._probando = False
+            if self._fallos >= self.max_fallos:
+                self._abierto_desde = time.monotonic()
+
+
+class ServiceClient:
+    """
+    Cliente HTTP de un microservicio: una requests.Session con pool de
+    conexiones keep-alive, timeouts de conexión/lectura, reintentos con
+    backoff aleatorio y circuit breaker.
+
+    Solo se reintentan errores de conexión y 502/503/504: un timeout de
+    lectura no, porque cada reintento volvería a esperar el timeout completo
+    y un servicio colgado retendría el hilo varias veces ese tiempo.
+    """
+
+    def __init__(self, nombre, base_url, pool_size=10, connect_timeout=3.05, read_timeout=10,
+                 retries=2, backoff=0.2, backoff_jitter=0.3, breaker=None):
+        self.nombre = nombre
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker = breaker
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            backoff_factor=backoff,
+            backoff_jitter=backoff_jitter,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, path, token=None, timeout=None, **kwargs):
+        """
+        GET a `base_url + path`. `timeout` acota el de lectura (p. ej. con
+        lo que queda del presupuesto de la petición).
+        """
+        prueba = self.breaker.antes_de_llamar() if self.breaker else False
+
+        read_timeout = self.read_timeout if timeout is None else min(timeout, self.read_timeout)
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        try:
+            res = self.session.get(
+                f"{self.base_url}{path}",
+                headers=headers,
+                timeout=(self.connect_timeout, read_timeout),
+                **kwargs
+            )
+        except requests.RequestException:
+            if self.breaker:
+                self.breaker.fallo()
+            raise
+        except BaseException:
+            if prueba:
+                self.breaker.liberar_prueba()
+            raise
+
+        if self.breaker:
+            if res.status_code >= 500:
+                self.breaker.fallo()
+            else:
+                self.breaker.exito()
+        return res
+
+
+class AsyncServiceClient:
+    """
+    Versión async de ServiceClient sobre httpx. Mantiene un AsyncClient (con
+    su pool keep-alive) por event loop y comparte el circuit breaker con el
+    cliente síncrono del mismo servicio. Mismos reintentos: nunca tras un
+    timeout de lectura, y sin pasar del `timeout` que recibe `get`.
+    """
+
+    RETRY_STATUS = (502, 503, 504)
+
+    def __init__(self, nombre, base_url, pool_size=10, connect_timeout=3.05, read_timeout=10,
+                 retries=2, backoff=0.2, backoff_jitter=0.3, breaker=None):
+        self.nombre = nombre
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_jitter = backoff_jitter
+        self.breaker = breaker
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+        return client
+
+    async def get(self, path, token=None, timeout=None, **kwargs):
+        prueba = self.breaker.antes_de_llamar() if self.breaker else False
+        try:
+            return await self._get(path, token, timeout, **kwargs)
+        except BaseException:
+            # Cancelada a mitad de la prueba: si no, el circuito no volvería a probar
+            if prueba:
+                self.breaker.liberar_prueba()
+            raise
+
+    async def _get(self, path, token, timeout, **kwargs):
+
+        read_timeout = self.read_timeout if timeout is None else min(timeout, self.read_timeout)
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        # Con `timeout` los reintentos comparten ese presupuesto
+        limite = None if timeout is None else time.monotonic() + timeout
+        client = self._client()
+        for intento in range(self.retries + 1):
+            try:
+                res = await client.get(
+                    f"{self.base_url}{path}",
+                    headers=headers,
+                    timeout=httpx.Timeout(read_timeout, connect=self.connect_timeout),
+                    **kwargs
+                )
+            except httpx.TransportError as e:
+                espera = self._espera(intento, limite)
+                if espera is None or isinstance(e, httpx.ReadTimeout):
+                    if self.breaker:
+                        self.breaker.fallo()
+                    raise
+            else:
+                espera = self._espera(intento, limite) if res.status_code in self.RETRY_STATUS else None
+                if espera is None:
+                    if self.breaker:
+                        if res.status_code >= 500:
+                            self.breaker.fallo()
+                        else:
+                            self.breaker.exito()
+                    return res
+
+            await asyncio.sleep(espera)
+            if limite is not None:
+                read_timeout = max(min(read_timeout, limite - time.monotonic()), 0.1)
+
+    def _espera(self, intento, limite):
+        """
+        Segundos de backoff antes del siguiente intento, o None si no quedan
+        reintentos o el backoff ya no cabe en el presupuesto.
+        """
+        if intento >= self.retries:
+            return None
+        espera = self.backoff * (2 ** intento) + random.uniform(0, self.backoff_jitter)
+        if limite is not None and time.monotonic() + espera >= limite:
+            return None
+        return espera
+
+_clients = {}
+_clients_lock = threading.RLock()  # la factory de un cliente pide su breaker
+
+
+def _crear_cliente(cls, nombre, base_url, pool_size, read_timeout):
+    return cls(
+        nombre,
+        base_url,
+        pool_size=pool_size,
+        connect_timeout=getattr(settings, "SERVICE_CONNECT_TIMEOUT", 3.05),
+        read_timeout=read_timeout,
+        retries=getattr(settings, "SERVICE_RETRIES", 2),
+        backoff=getattr(settings, "SERVICE_BACKOFF", 0.2),
+        backoff_jitter=getattr(settings, "SERVICE_BACKOFF_JITTER", 0.3),
+        breaker=_cliente(f"breaker:{nombre}", lambda: CircuitBreaker(
+            nombre,
+            max_fallos=getattr(settings, "CIRCUIT_BREAKER_FAILURES", 5),
+            reset_timeout=getattr(settings, "CIRCUIT_BREAKER_RESET", 30),
+        )),
+    )
+
+
+def _cliente(nombre, factory):
+    client = _clients.get(nombre)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(nombre)
+            if client is None:
+                client = _clients[nombre] = factory()
+    return client
+
+
+def reiniciar_clientes():
+    """
+    Descarta los clientes (y sus breakers) para que los siguientes tomen la
+    configuración actual, p. ej. las URLs de servicios falsos en benchmarks.
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            if isinstance(client, ServiceClient):
+                client.session.close()
+        _clients.clear()
+
+
+def _cliente_usuarios(cls):
+    return _cliente(f"usuarios:{cls.__name__}", lambda: _crear_cliente(
+        cls,
+        "usuarios",
+        settings.USERS_SERVICE_URL,
+        getattr(settings, "USERS_SERVICE_POOL_SIZE", 10),
+        getattr(settings, "USERS_SERVICE_READ_TIMEOUT", 10),
+    ))
+
+
+def _cliente_ejercicios(cls):
+    return _cliente(f"ejercicios:{cls.__name__}", lambda: _crear_cliente(
+        cls,
+        "ejercicios",
+        settings.EXERCISES_SERVICE_URL,
+        getattr(settings, "EXERCISES_SERVICE_POOL_SIZE", 10),
+        getattr(settings, "EXERCISES_SERVICE_READ_TIMEOUT", 50),
+    ))
+
+
+def users_client():
+    return _cliente_usuarios(ServiceClient)
+
+
+def exercises_client():
+    return _cliente_ejercicios(ServiceClient)
+
+
+def users_async_client():
+    return _cliente_usuarios(AsyncServiceClient)
+
+
+def exercises_async_client():
+    return _cliente_ejercicios(AsyncServiceClient)
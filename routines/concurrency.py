@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+
+class _Llamada:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce llamadas concurrentes con la misma clave: solo la primera
+    ejecuta `fn` y las demás esperan y reciben su mismo resultado (o error).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._llamadas = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            llamada = self._llamadas.get(key)
+            lider = llamada is None
+            if lider:
+                llamada = self._llamadas[key] = _Llamada()
+
+        if not lider:
+            llamada.event.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.result
+
+        try:
+            llamada.result = fn()
+            return llamada.result
+        except Exception as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._llamadas[key]
+            llamada.event.set()
+
+
+class AsyncSingleFlight:
+    """
+    Equivalente de SingleFlight para corrutinas del mismo event loop.
+    """
+
+    def __init__(self):
+        self._llamadas = {}
+
+    async def do(self, key, fn):
+        loop = asyncio.get_running_loop()
+        while True:
+            llamada = self._llamadas.get(key)
+            if llamada is None or llamada.get_loop() is not loop:
+                break
+            try:
+                return await asyncio.shield(llamada)
+            except asyncio.CancelledError:
+                # Si se canceló al líder (p. ej. su cliente se desconectó) y no
+                # a esta tarea, se vuelve a intentar y esta toma el relevo
+                if not llamada.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        llamada = self._llamadas[key] = loop.create_future()
+        try:
+            resultado = await fn()
+        except Exception as e:
+            llamada.set_exception(e)
+            # Nadie más la esperaba: se marca como leída para no avisar en el log
+            llamada.exception()
+            raise
+        else:
+            llamada.set_result(resultado)
+            return resultado
+        finally:
+            if not llamada.done():
+                # Cancelaron al líder: los que esperan no deben quedarse colgados
+                llamada.cancel()
+            if self._llamadas.get(key) is llamada:
+                del self._llamadas[key]
@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .concurrency import SingleFlight, AsyncSingleFlight
+from .models import ClaveIdempotencia
+
+LARGO_MAXIMO_CLAVE = 255
+
+# Margen (segundos) para guardar la rutina después de llamar a los otros MS
+MARGEN_GUARDADO = 30
+
+# Respuesta para un reintento que llega mientras la primera petición aún genera (en otro proceso)
+EN_CURSO = (409, {"error": "Ya hay una petición en curso con este Idempotency-Key"})
+
+
+def clave_valida(clave):
+    return 0 < len(clave) <= LARGO_MAXIMO_CLAVE
+
+
+def en_curso_maximo():
+    """
+    Segundos tras los que una clave que sigue en curso se da por abandonada
+    (proceso caído). Cubre la peor generación posible: el perfil con todos
+    sus reintentos y backoffs, el presupuesto de los ejercicios y el guardado.
+    """
+    reintentos = getattr(settings, "SERVICE_RETRIES", 2)
+    backoff = getattr(settings, "SERVICE_BACKOFF", 0.2)
+    jitter = getattr(settings, "SERVICE_BACKOFF_JITTER", 0.3)
+    intento = getattr(settings, "SERVICE_CONNECT_TIMEOUT", 3.05) + getattr(settings, "USERS_SERVICE_READ_TIMEOUT", 10)
+    perfil = (reintentos + 1) * intento + sum(backoff * 2 ** i + jitter for i in range(reintentos))
+    return perfil + getattr(settings, "EXERCISES_FETCH_DEADLINE", 60) + MARGEN_GUARDADO
+
+
+def reclamar(user_id, clave):
+    """
+    Registra la clave como en curso y devuelve None si es nueva (o la que
+    había venció). Si ya existía devuelve su (status_code, respuesta);
+    status_code es None mientras la otra petición no termine.
+    """
+    ahora = timezone.now()
+    ttl = getattr(settings, "IDEMPOTENCY_KEY_TTL", 86400)
+    ClaveIdempotencia.objects.filter(user_id=user_id, clave=clave).filter(
+        Q(created_at__lt=ahora - timedelta(seconds=ttl))
+        | Q(status_code__isnull=True, created_at__lt=ahora - timedelta(seconds=en_curso_maximo()))
+    ).delete()
+
+    try:
+        with transaction.atomic():
+            ClaveIdempotencia.objects.create(user_id=user_id, clave=clave)
+        return None
+    except IntegrityError:
+        pass
+
+    guardada = (
+        ClaveIdempotencia.objects
+        .filter(user_id=user_id, clave=clave)
+        .values_list("status_code", "respuesta")
+        .first()
+    )
+    return guardada or (None, None)
+
+
+def guardar(user_id, clave, status_code, respuesta):
+    """
+    Guarda la respuesta final de la clave. Los errores 5xx (MS caídos,
+    timeouts) no se guardan: se libera la clave para que el reintento genere.
+    """
+    claves = ClaveIdempotencia.objects.filter(user_id=user_id, clave=clave)
+    if status_code >= 500:
+        claves.delete()
+    else:
+        claves.update(status_code=status_code, respuesta=respuesta)
+
+
+def liberar(user_id, clave):
+    ClaveIdempotencia.objects.filter(user_id=user_id, clave=clave, status_code__isnull=True).delete()
+
+
+def purgar_claves(antes_de, chunk_size=1000):
+    """
+    Borra en lotes las claves creadas antes de `antes_de`; ya vencidas, solo
+    ocupan espacio. Devuelve cuántas se borraron.
+    """
+    total = 0
+    while True:
+        ids = list(
+            ClaveIdempotencia.objects
+            .filter(created_at__lt=antes_de)
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return total
+        total += ClaveIdempotencia.objects.filter(id__in=ids).delete()[0]
+
+
+_claves_en_vuelo = SingleFlight()
+_claves_en_vuelo_async = AsyncSingleFlight()
+
+
+def con_idempotencia(user_id, clave, ejecutar):
+    """
+    Ejecuta `ejecutar() -> (status_code, cuerpo)` una sola vez por
+    (usuario, Idempotency-Key) y devuelve (status_code, cuerpo, repetida).
+    Los reintentos reciben la respuesta guardada (repetida=True); sin clave
+    se ejecuta siempre.
+    """
+    if not clave:
+        return (*ejecutar(), False)
+    marca = object()
+    resultado = _claves_en_vuelo.do(
+        (user_id, clave), lambda: (*_ejecutar_una_vez(user_id, clave, ejecutar), marca)
+    )
+    return _respuesta(resultado, marca)
+
+
+def _respuesta(resultado, marca):
+    """
+    (status_code, cuerpo, repetida) para quien llamó. Si esperó a otra
+    petición del mismo proceso con la misma clave, su respuesta también
+    cuenta como repetida (salvo los 5xx, que no se guardan, y el 409).
+    """
+    status_code, cuerpo, repetida, lider = resultado
+    if lider is not marca and status_code < 500 and (status_code, cuerpo) != EN_CURSO:
+        repetida = True
+    return status_code, cuerpo, repetida
+
+
+def _ejecutar_una_vez(user_id, clave, ejecutar):
+    guardada = reclamar(user_id, clave)
+    if guardada is not None:
+        status_code, respuesta = guardada
+        if status_code is None:
+            return (*EN_CURSO, False)
+        return status_code, respuesta, True
+
+    try:
+        status_code, cuerpo = ejecutar()
+    except BaseException:
+        liberar(user_id, clave)
+        raise
+    guardar(user_id, clave, status_code, cuerpo)
+    return status_code, cuerpo, False
+
+
+async def acon_idempotencia(user_id, clave, ejecutar):
+    """
+    Versión async de con_idempotencia; `ejecutar` es una corrutina.
+    """
+    if not clave:
+        return (*await ejecutar(), False)
+    marca = object()
+
+    async def una_vez():
+        return (*await _aejecutar_una_vez(user_id, clave, ejecutar), marca)
+
+    return _respuesta(await _claves_en_vuelo_async.do((user_id, clave), una_vez), marca)
+
+
+async def _aejecutar_una_vez(user_id, clave, ejecutar):
+    guardada = await sync_to_async(reclamar)(user_id, clave)
+    if guardada is not None:
+        status_code, respuesta = guardada
+        if status_code is None:
+            return (*EN_CURSO, False)
+        return status_code, respuesta, True
+
+    try:
+        status_code, cuerpo = await ejecutar()
+    except BaseException:
+        await sync_to_async(liberar)(user_id, clave)
+        raise
+    await sync_to_async(guardar)(user_id, clave, status_code, cuerpo)
+    return status_code, cuerpo, False
@@ -0,0 +1,85 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RutinaJob
+from .services import generar_rutina, perfil_usuario
+
+
+def encolar_generacion(user_id, token):
+    """
+    Encola la generación con el perfil ya resuelto: el JWT del usuario no se
+    guarda, el worker solo necesita la credencial de servicio para Ejercicios.
+    Propaga los errores de perfil_usuario.
+    """
+    perfil = perfil_usuario(user_id, token)
+    return RutinaJob.objects.create(user_id=user_id, experience=perfil["experience"], goal=perfil["goal"])
+
+
+def reclamar_job():
+    """
+    Toma el job pendiente más antiguo sin bloquear a otros workers. También
+    recupera jobs que quedaron en proceso más tiempo del permitido (worker caído).
+    """
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "ROUTINE_JOB_STALE_SECONDS", 600))
+    with transaction.atomic():
+        job = (
+            RutinaJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(estado=RutinaJob.PENDIENTE) | Q(estado=RutinaJob.EN_PROCESO, started_at__lt=limite))
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.estado = RutinaJob.EN_PROCESO
+        job.started_at = timezone.now()
+        job.save(update_fields=["estado", "started_at"])
+    return job
+
+
+def ejecutar_job(job):
+    token = getattr(settings, "EXERCISES_SERVICE_TOKEN", "") or None
+    try:
+        rutina = generar_rutina(job.user_id, token, profile={"experience": job.experience, "goal": job.goal})
+    except Exception as e:
+        job.estado = RutinaJob.FALLIDO
+        job.error = str(e)
+    else:
+        job.estado = RutinaJob.COMPLETADO
+        job.rutina = rutina
+    job.finished_at = timezone.now()
+    job.save(update_fields=["estado", "error", "rutina", "finished_at"])
+    return job
+
+
+def procesar_jobs(detener, espera=1.0):
+    """
+    Bucle de un worker: reclama y ejecuta jobs hasta que se active `detener`.
+    """
+    while not detener.is_set():
+        close_old_connections()
+        job = reclamar_job()
+        if job is None:
+            detener.wait(espera)
+            continue
+        ejecutar_job(job)
+    close_old_connections()
+
+
+def iniciar_workers(hilos, espera=1.0):
+    """
+    Arranca `hilos` workers en segundo plano. Devuelve (evento para detenerlos, hilos).
+    """
+    detener = threading.Event()
+    workers = [
+        threading.Thread(target=procesar_jobs, args=(detener, espera), name=f"rutina-worker-{i}", daemon=True)
+        for i in range(hilos)
+    ]
+    for w in workers:
+        w.start()
+    return detener, workers
@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from routines.archive import archivar_rutinas, rutinas_archivables
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve a RutinaArchivada (o borra, con --purge) las rutinas más viejas "
+        "que --older-than días, en lotes cortos y espaciados. La última rutina "
+        "de cada usuario nunca se toca. Las archivadas dejan de aparecer en "
+        "/routines/all/ pero se siguen sirviendo por id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=settings.ROUTINE_ARCHIVE_AFTER_DAYS, help="Días")
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--sleep", type=float, default=0.5, help="Segundos de pausa entre lotes")
+        parser.add_argument("--max-chunks", type=int, help="Detenerse tras N lotes")
+        parser.add_argument("--purge", action="store_true", help="Borrar sin copiar a RutinaArchivada")
+        parser.add_argument("--dry-run", action="store_true", help="Solo contar las rutinas afectadas")
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(days=options["older_than"])
+        if options["dry_run"]:
+            total = rutinas_archivables(antes_de).count()
+            self.stdout.write(f"{total} rutinas anteriores a {antes_de:%Y-%m-%d} se archivarían")
+            return
+
+        inicio = time.perf_counter()
+        total = 0
+        for n in archivar_rutinas(
+            antes_de,
+            chunk_size=options["chunk_size"],
+            pausa=options["sleep"],
+            archivar=not options["purge"],
+            max_lotes=options["max_chunks"],
+        ):
+            total += n
+            self.stdout.write(f"  lote de {n} ({total} en total)")
+
+        accion = "borradas" if options["purge"] else "archivadas"
+        self.stdout.write(f"{total} rutinas {accion} en {time.perf_counter() - inicio:.1f}s")
@@ -0,0 +1,460 @@
+import importlib.util
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.test.runner import DiscoverRunner
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from routines import utils
+from routines.authentication import MicroserviceUser
+from routines.benchmarks import ServiciosFalsos, catalogo_falso
+from routines.selection import SelectorEjercicios
+from routines.clients import reiniciar_clientes
+from routines.models import Rutina
+from routines.services import DEFAULT_SPLIT, construir_rutina, guardar_rutinas, rellenar_plantillas
+
+# Endpoints que mide el escenario "suite"
+ENDPOINTS = ["generate", "all", "active", "days"]
+
+# Escenarios que no necesitan base de datos
+SIN_DB = {"normalizer", "selection"}
+
+
+def resumen_latencias(muestras):
+    """
+    p50/p95/p99 (ms) de una lista de latencias en segundos.
+    """
+    cuantiles = statistics.quantiles(muestras, n=100)
+    return {
+        "p50": cuantiles[49] * 1000,
+        "p95": cuantiles[94] * 1000,
+        "p99": cuantiles[98] * 1000,
+    }
+
+
+def tiempos_server_timing(valor):
+    """
+    {etapa: ms} de una cabecera Server-Timing, sumando las etapas repetidas
+    (p. ej. los ejercicios de cada músculo). Se omite la entrada de la DB.
+    """
+    tiempos = defaultdict(float)
+    for parte in filter(None, (valor or "").split(", ")):
+        nombre, *params = parte.split(";")
+        if nombre == "db":
+            continue
+        for param in params:
+            if param.startswith("dur="):
+                tiempos[nombre] += float(param[4:])
+    return tiempos
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks de los endpoints de rutinas. Se ejecutan sobre una base "
+        "de datos de pruebas desechable, nunca sobre la configurada "
+        "(con DB_ENGINE=django.db.backends.sqlite3 corren sobre SQLite)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=["active", "connections", "normalizer", "selection", "suite"])
+        parser.add_argument("--routines", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, help="por defecto 50000 en active y 200 en suite y connections")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--catalog-size", type=int, default=2_000)
+        parser.add_argument("--rounds", type=int, default=50)
+        parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument("--latency", type=float, default=20, help="ms de los servicios falsos")
+        parser.add_argument("--failure-rate", type=float, default=0.0)
+        parser.add_argument("--routines-per-user", type=int, default=5)
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument("--templates", type=int, default=0, help="plantillas por perfil antes de medir")
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        if options["scenario"] in SIN_DB:
+            getattr(self, f"scenario_{options['scenario']}")(options)
+            return
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            getattr(self, f"scenario_{options['scenario']}")(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def sembrar_rutinas(self, total, usuarios, batch_size):
+        ahora = timezone.now()
+        creadas = 0
+        while creadas < total:
+            n = min(batch_size, total - creadas)
+            Rutina.objects.bulk_create([
+                Rutina(
+                    id=uuid.uuid4(),
+                    user_id=random.randint(1, usuarios),
+                    duracion_minutos=40,
+                )
+                for _ in range(n)
+            ])
+            creadas += n
+        # auto_now_add fija la misma hora a todo el lote; se reparten en el tiempo
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM routines_rutina")
+            ids = [row[0] for row in cursor.fetchall()]
+        for i in range(0, len(ids), batch_size):
+            lote = ids[i:i + batch_size]
+            Rutina.objects.filter(id__in=lote).update(
+                created_at=ahora - timedelta(minutes=random.randint(0, 525_600))
+            )
+        self.analizar()
+        self.stdout.write(f"Sembradas {total} rutinas para {usuarios} usuarios")
+
+    def analizar(self):
+        # Estadísticas frescas para que el planner de Postgres use el índice
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE routines_rutina")
+
+    @override_settings(ACTIVE_ROUTINE_CACHE_TTL=0)
+    def medir_active(self, usuarios, peticiones):
+        # Sin la caché de rutina activa: se mide la consulta a la DB
+        muestras = []
+        client = APIClient()
+        for _ in range(peticiones):
+            client.force_authenticate(user=MicroserviceUser(random.randint(1, usuarios)))
+            inicio = time.perf_counter()
+            res = client.get("/routines/active/")
+            muestras.append(time.perf_counter() - inicio)
+            assert res.status_code == 200
+        return resumen_latencias(muestras)
+
+    def scenario_active(self, options):
+        """
+        Latencia de /routines/active/ sin y con el índice (user_id, -created_at).
+        """
+        options["users"] = options["users"] or 50_000
+        self.sembrar_rutinas(options["routines"], options["users"], options["batch_size"])
+
+        indice = next(i for i in Rutina._meta.indexes if i.name == "rutina_user_created_idx")
+        with connection.schema_editor() as editor:
+            editor.remove_index(Rutina, indice)
+        antes = self.medir_active(options["users"], options["requests"])
+
+        with connection.schema_editor() as editor:
+            editor.add_index(Rutina, indice)
+        self.analizar()
+        despues = self.medir_active(options["users"], options["requests"])
+
+        for etiqueta, valores in (("sin índice", antes), ("con índice", despues)):
+            self.stdout.write(
+                f"{etiqueta:>11}: " + "  ".join(f"{k}={v:.2f}ms" for k, v in valores.items())
+            )
+
+    def scenario_normalizer(self, options):
+        """
+        normalize_text (tabla + LRU) contra la versión NFD original sobre un
+        catálogo con etiquetas realistas: dos normalizaciones por ejercicio.
+        """
+        musculos = ["Pierna", "Glúteo", "Pecho", "Espalda", "Hombros", "Brazos", "Abdomen", "Cuerpo Completo"]
+        dificultades = ["Principiante", "Intermedio", "Avanzado"]
+        catalogo = [
+            {"muscle_group_display": random.choice(musculos), "difficulty_display": random.choice(dificultades)}
+            for _ in range(options["catalog_size"])
+        ]
+
+        def original(t):
+            if not t:
+                return ""
+            return utils._quitar_acentos_nfd(t).strip().lower().replace(" ", "_")
+
+        implementaciones = {
+            "NFD original": original,
+            "tabla": utils.normalize_text.__wrapped__,
+            "tabla + LRU": utils.normalize_text,
+        }
+        for nombre, normalizar in implementaciones.items():
+            inicio = time.perf_counter()
+            for _ in range(options["rounds"]):
+                for item in catalogo:
+                    normalizar(item["muscle_group_display"])
+                    normalizar(item["difficulty_display"])
+            total = time.perf_counter() - inicio
+            por_item = total / (options["rounds"] * len(catalogo)) * 1e6
+            self.stdout.write(f"{nombre:>13}: {total * 1000:8.1f}ms total  {por_item:.3f}µs/ejercicio")
+
+    def scenario_selection(self, options):
+        """
+        Selección de una semana: barajar la lista completa de cada día contra
+        SelectorEjercicios (muestreo O(k) con índices por equipo reutilizados).
+        """
+        ejercicios = {m: [] for m in DEFAULT_SPLIT.values()}
+        for item in catalogo_falso(options["catalog_size"]):
+            ejercicios[item["muscle_group"]].append(item)
+
+        def barajar():
+            for musculo in DEFAULT_SPLIT.values():
+                lista = list(ejercicios[musculo])
+                random.shuffle(lista)
+                lista[:5]
+
+        selector = SelectorEjercicios(ejercicios, seed=options["seed"])
+        implementaciones = {
+            "shuffle": barajar,
+            "selector": lambda: selector.semana(DEFAULT_SPLIT, 5),
+        }
+        for nombre, semana in implementaciones.items():
+            inicio = time.perf_counter()
+            for _ in range(options["rounds"]):
+                semana()
+            total = time.perf_counter() - inicio
+            self.stdout.write(f"{nombre:>9}: {total * 1000:8.1f}ms total  {total / options['rounds'] * 1e6:.1f}µs/semana")
+
+    def scenario_suite(self, options):
+        """
+        /generate/, /all/, /active/ y /<id>/days/ contra MS de Usuarios y
+        Ejercicios falsos: throughput, p50/p95/p99, consultas por petición y,
+        para la generación, el tiempo medio de cada etapa (Server-Timing).
+        """
+        usuarios = options["users"] or 200
+        servicios = ServiciosFalsos(
+            latencia=options["latency"] / 1000,
+            tasa_fallos=options["failure_rate"],
+            catalogo=options["catalog_size"],
+            seed=options["seed"],
+        )
+        with servicios, override_settings(
+            USERS_SERVICE_URL=servicios.url,
+            EXERCISES_SERVICE_URL=servicios.url,
+        ):
+            reiniciar_clientes()
+            utils.exercise_catalog.clear()
+            try:
+                rutinas = self.sembrar_arboles(usuarios, options["routines_per_user"], options["catalog_size"])
+                if options["templates"]:
+                    nuevas, _ = rellenar_plantillas(None, options["templates"])
+                    self.stdout.write(f"{len(nuevas)} plantillas en el pool")
+                for endpoint in options["endpoints"]:
+                    resultado = self.medir_endpoint(endpoint, rutinas, options["requests"], options["concurrency"])
+                    self.reportar(endpoint, resultado)
+                self.stdout.write(f"Servicios falsos: {dict(servicios.peticiones)}")
+            finally:
+                reiniciar_clientes()
+                utils.exercise_catalog.clear()
+
+    def scenario_connections(self, options):
+        """
+        Costo de conectarse a la DB en cada petición: /routines/<id>/days/ con
+        el mismo ciclo de conexiones que una petición real (close_old_connections
+        al empezar y al terminar) sin persistencia, con conexiones persistentes
+        (con y sin health check) y, en Postgres con psycopg 3, con el pool.
+        """
+        if connection.vendor != "postgresql":
+            self.stdout.write(
+                "Aviso: la DB de pruebas de SQLite vive en memoria y Django nunca la "
+                "cierra; este escenario solo es representativo sobre Postgres"
+            )
+        rutinas = self.sembrar_arboles(options["users"] or 200, 1, options["catalog_size"])
+
+        modos = {
+            "por petición": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+            "persistente": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": False},
+            "persistente + health check": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+        }
+        if connection.vendor == "postgresql" and importlib.util.find_spec("psycopg_pool"):
+            from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+            if is_psycopg3:
+                tamano = options["concurrency"]
+                modos["pool"] = {
+                    "CONN_MAX_AGE": 0,
+                    "CONN_HEALTH_CHECKS": False,
+                    "OPTIONS": {
+                        **connection.settings_dict["OPTIONS"],
+                        "pool": {"min_size": tamano, "max_size": tamano},
+                    },
+                }
+        else:
+            self.stdout.write("Sin pool: requiere Postgres con psycopg[pool]")
+
+        for nombre, ajustes in modos.items():
+            r = self.medir_conexiones(rutinas, options["requests"], options["concurrency"], ajustes)
+            latencias = "  ".join(f"{k}={v:.2f}ms" for k, v in r["latencias"].items())
+            self.stdout.write(
+                f"{nombre:>26}: {r['throughput']:.1f} req/s  {latencias}  "
+                f"conexiones nuevas={r['conexiones']} ({r['conexiones'] / r['peticiones']:.2f}/petición)"
+            )
+
+    def medir_conexiones(self, rutinas, peticiones, concurrencia, ajustes):
+        original = dict(connection.settings_dict)
+        connection.close()
+        connection.settings_dict.update(ajustes)
+
+        abiertas = []
+
+        def contar(sender, connection, **kwargs):
+            abiertas.append(connection.alias)
+
+        muestras = []
+        lock = threading.Lock()
+
+        def worker(indice, total):
+            client = APIClient()
+            rng = random.Random(indice)
+            propias = []
+            try:
+                for _ in range(total):
+                    rutina_id, user_id = rng.choice(rutinas)
+                    client.force_authenticate(user=MicroserviceUser(user_id))
+                    inicio = time.perf_counter()
+                    # El cliente de pruebas no emite request_started/finished: se replica su efecto
+                    close_old_connections()
+                    res = client.get(f"/routines/{rutina_id}/days/")
+                    close_old_connections()
+                    propias.append(time.perf_counter() - inicio)
+                    assert res.status_code == 200
+            finally:
+                connection.close()
+                with lock:
+                    muestras.extend(propias)
+
+        connection_created.connect(contar)
+        try:
+            inicio = time.perf_counter()
+            reparto = [peticiones // concurrencia + (i < peticiones % concurrencia) for i in range(concurrencia)]
+            hilos = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(reparto)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            total = time.perf_counter() - inicio
+
+            if connection.settings_dict.get("OPTIONS", {}).get("pool"):
+                # Con pool la señal se emite en cada préstamo: se cuentan las conexiones reales
+                conexiones = connection.pool.get_stats().get("connections_num", 0)
+                connection.close_pool()
+            else:
+                conexiones = len(abiertas)
+        finally:
+            connection_created.disconnect(contar)
+            connection.settings_dict.clear()
+            connection.settings_dict.update(original)
+
+        return {
+            "peticiones": len(muestras),
+            "throughput": len(muestras) / total,
+            "latencias": resumen_latencias(muestras),
+            "conexiones": conexiones,
+        }
+
+    def sembrar_arboles(self, usuarios, por_usuario, catalog_size, chunk_size=500):
+        """
+        Rutinas completas (días, ejercicios y snapshot) para cada usuario.
+        Devuelve [(rutina_id, user_id)].
+        """
+        ejercicios = {m: [] for m in DEFAULT_SPLIT.values()}
+        for item in catalogo_falso(catalog_size):
+            ejercicios[item["muscle_group"]].append(item)
+
+        arboles = [
+            construir_rutina(user_id, 40, "ganar_musculo", "principiante", ejercicios)
+            for user_id in range(1, usuarios + 1)
+            for _ in range(por_usuario)
+        ]
+        rutinas = []
+        for i in range(0, len(arboles), chunk_size):
+            rutinas.extend((r.id, r.user_id) for r in guardar_rutinas(arboles[i:i + chunk_size]))
+        self.analizar()
+        self.stdout.write(f"Sembradas {len(rutinas)} rutinas para {usuarios} usuarios")
+        return rutinas
+
+    def medir_endpoint(self, endpoint, rutinas, peticiones, concurrencia):
+        muestras = []
+        lock = threading.Lock()
+
+        def peticion(client, rng):
+            rutina_id, user_id = rng.choice(rutinas)
+            client.force_authenticate(user=MicroserviceUser(user_id))
+            if endpoint == "generate":
+                return client.post("/routines/generate/")
+            if endpoint == "days":
+                return client.get(f"/routines/{rutina_id}/days/")
+            return client.get(f"/routines/{endpoint}/")
+
+        def worker(indice, total, hilo_propio=True):
+            client = APIClient()
+            rng = random.Random(indice)
+            propias = []
+            try:
+                for _ in range(total):
+                    with CaptureQueriesContext(connection) as consultas:
+                        inicio = time.perf_counter()
+                        res = peticion(client, rng)
+                        latencia = time.perf_counter() - inicio
+                    propias.append((
+                        latencia,
+                        res.status_code,
+                        len(consultas),
+                        tiempos_server_timing(res.get("Server-Timing")),
+                    ))
+            finally:
+                if hilo_propio:
+                    connection.close()
+                with lock:
+                    muestras.extend(propias)
+
+        inicio = time.perf_counter()
+        if concurrencia == 1:
+            # En el hilo principal, sobre la misma conexión de la DB de pruebas
+            worker(0, peticiones, hilo_propio=False)
+        else:
+            reparto = [peticiones // concurrencia + (i < peticiones % concurrencia) for i in range(concurrencia)]
+            hilos = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(reparto)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        total = time.perf_counter() - inicio
+
+        etapas = defaultdict(float)
+        for *_, tiempos in muestras:
+            for nombre, ms in tiempos.items():
+                etapas[nombre] += ms
+        return {
+            "peticiones": len(muestras),
+            "errores": sum(1 for _, status, *_ in muestras if status >= 400),
+            "throughput": len(muestras) / total,
+            "latencias": resumen_latencias([m[0] for m in muestras]),
+            "consultas": [m[2] for m in muestras],
+            "etapas": {k: v / len(muestras) for k, v in etapas.items()},
+        }
+
+    def reportar(self, endpoint, r):
+        latencias = "  ".join(f"{k}={v:.2f}ms" for k, v in r["latencias"].items())
+        self.stdout.write(
+            f"{endpoint:>8}: {r['peticiones']} peticiones, {r['errores']} errores, "
+            f"{r['throughput']:.1f} req/s  {latencias}  "
+            f"consultas media={statistics.mean(r['consultas']):.1f} max={max(r['consultas'])}"
+        )
+        if r["etapas"]:
+            self.stdout.write(
+                " " * 10 + "etapas (ms medios): "
+                + "  ".join(f"{k}={v:.2f}" for k, v in r["etapas"].items())
+            )
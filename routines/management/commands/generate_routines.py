@@ -0,0 +1,46 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from routines.serializers import PerfilLoteSerializer
+from routines.services import generar_rutinas_lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera rutinas en lote a partir de un JSON con una lista de perfiles "
+        "({user_id, experience, goal})."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Archivo JSON con los perfiles, o - para stdin")
+        parser.add_argument(
+            "--token",
+            default=os.getenv("EXERCISES_SERVICE_TOKEN"),
+            help="JWT para el MS de Ejercicios (por defecto EXERCISES_SERVICE_TOKEN)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options["input"] == "-":
+            datos = json.load(sys.stdin)
+        else:
+            with open(options["input"], encoding="utf-8") as f:
+                datos = json.load(f)
+
+        serializer = PerfilLoteSerializer(data=datos, many=True)
+        if not serializer.is_valid():
+            raise CommandError(f"Perfiles inválidos: {serializer.errors}")
+
+        inicio = time.perf_counter()
+        creadas, errores = generar_rutinas_lote(
+            serializer.validated_data, options["token"], chunk_size=options["chunk_size"]
+        )
+        duracion = time.perf_counter() - inicio
+
+        for user_id, error in errores:
+            self.stderr.write(f"user {user_id}: {error}")
+        self.stdout.write(f"{len(creadas)} rutinas creadas, {len(errores)} errores en {duracion:.1f}s")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from routines.cache import invalidar_perfil
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarta el perfil cacheado de uno o varios usuarios. Solo afecta a "
+        "los workers si CACHE_BACKEND es compartido (Redis, Memcached, DB...)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_ids", nargs="+", type=int)
+
+    def handle(self, *args, **options):
+        for user_id in options["user_ids"]:
+            invalidar_perfil(user_id)
+        self.stdout.write(f"Perfiles invalidados: {len(options['user_ids'])}")
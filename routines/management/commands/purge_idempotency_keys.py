@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from routines.idempotency import purgar_claves
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las respuestas guardadas de Idempotency-Key que ya vencieron "
+        "(más viejas que IDEMPOTENCY_KEY_TTL). Pensado para correr periódicamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=settings.IDEMPOTENCY_KEY_TTL, help="Segundos")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(seconds=options["older_than"])
+        total = purgar_claves(antes_de, chunk_size=options["chunk_size"])
+        self.stdout.write(f"{total} claves de idempotencia borradas")
@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from routines.services import rellenar_plantillas
+
+
+class Command(BaseCommand):
+    help = (
+        "Rellena el pool de rutinas pre-generadas por (objetivo, experiencia) "
+        "desde el catálogo de ejercicios. Con --loop se repite cada N segundos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--token",
+            default=os.getenv("EXERCISES_SERVICE_TOKEN"),
+            help="JWT para el MS de Ejercicios (por defecto EXERCISES_SERVICE_TOKEN)",
+        )
+        parser.add_argument("--per-profile", type=int, default=settings.ROUTINE_TEMPLATES_PER_PROFILE)
+        parser.add_argument(
+            "--max-age", type=int, default=settings.ROUTINE_TEMPLATE_MAX_AGE,
+            help="Segundos tras los que una plantilla se reemplaza (0 las conserva)",
+        )
+        parser.add_argument("--loop", type=float, default=0, help="Segundos entre rellenos (0: una sola vez)")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            inicio = time.perf_counter()
+            nuevas, errores = rellenar_plantillas(options["token"], options["per_profile"], options["max_age"])
+            for experiencia, error in errores:
+                self.stderr.write(f"{experiencia}: {error}")
+            self.stdout.write(f"{len(nuevas)} plantillas creadas en {time.perf_counter() - inicio:.1f}s")
+
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from routines.jobs import iniciar_workers
+
+
+class Command(BaseCommand):
+    help = "Procesa los jobs de generación de rutinas encolados en la DB."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--poll", type=float, default=1.0, help="Segundos de espera cuando no hay jobs")
+
+    def handle(self, *args, **options):
+        detener, workers = iniciar_workers(options["threads"], options["poll"])
+        self.stdout.write(f"{len(workers)} workers procesando jobs (Ctrl+C para detener)")
+        try:
+            for w in workers:
+                while w.is_alive():
+                    w.join(timeout=1)
+        except KeyboardInterrupt:
+            detener.set()
+            for w in workers:
+                w.join()
@@ -0,0 +1,223 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets (segundos) pensados para llamadas a otros MS y escrituras a la DB
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_registro = []
+
+
+class Histogram:
+    """
+    Histograma estilo Prometheus, en memoria del proceso (cada worker de
+    gunicorn expone el suyo).
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}  # valores de etiquetas -> [conteo por bucket, suma, total]
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def observe(self, valor, **etiquetas):
+        clave = tuple(str(etiquetas.get(e, "")) for e in self.etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def render(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for clave, conteos, suma, total in sorted(series):
+            base = [f'{e}="{v}"' for e, v in zip(self.etiquetas, clave)]
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                etiquetas = ",".join(base + [f'le="{limite}"'])
+                lineas.append(f"{self.nombre}_bucket{{{etiquetas}}} {acumulado}")
+            etiquetas = ",".join(base + ['le="+Inf"'])
+            lineas.append(f"{self.nombre}_bucket{{{etiquetas}}} {total}")
+            sufijo = "{" + ",".join(base) + "}" if base else ""
+            lineas.append(f"{self.nombre}_sum{sufijo} {suma}")
+            lineas.append(f"{self.nombre}_count{sufijo} {total}")
+        return "\n".join(lineas)
+
+
+class Counter:
+    """
+    Contador estilo Prometheus, en memoria del proceso.
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def inc(self, valor=1, **etiquetas):
+        clave = tuple(str(etiquetas.get(e, "")) for e in self.etiquetas)
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        return _render_series(self.nombre, self.ayuda, "counter", self.etiquetas, series)
+
+
+class Gauge:
+    """
+    Valor que se lee en el momento de exponer las métricas: `leer()` devuelve
+    [(valores de las etiquetas, valor)]. Con tipo="counter" sirve también para
+    contadores que lleva otra librería (p. ej. el pool de la DB).
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas, leer, tipo="gauge"):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.leer = leer
+        self.tipo = tipo
+        _registro.append(self)
+
+    def render(self):
+        return _render_series(self.nombre, self.ayuda, self.tipo, self.etiquetas, self.leer())
+
+
+def _render_series(nombre, ayuda, tipo, etiquetas, series):
+    lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+    for clave, valor in sorted(series):
+        base = ",".join(f'{e}="{v}"' for e, v in zip(etiquetas, clave))
+        sufijo = "{" + base + "}" if base else ""
+        lineas.append(f"{nombre}{sufijo} {valor}")
+    return "\n".join(lineas)
+
+
+def render_metricas():
+    return "\n".join(h.render() for h in _registro) + "\n"
+
+
+ETAPAS = Histogram(
+    "routines_generation_stage_seconds",
+    "Duración de cada etapa de la generación de rutinas",
+    ("stage", "muscle", "source"),
+)
+PETICIONES = Histogram(
+    "routines_request_seconds",
+    "Duración de las peticiones HTTP por vista",
+    ("view", "method", "status"),
+)
+CONSULTAS_DB = Histogram(
+    "routines_request_db_queries",
+    "Consultas a la DB por petición",
+    ("view",),
+    buckets=BUCKETS_CONSULTAS,
+)
+CONEXIONES_DB = Counter(
+    "routines_db_connections_total",
+    "Conexiones a la DB abiertas por Django (con pool: tomadas del pool)",
+    ("alias",),
+)
+
+
+def estadisticas_pools():
+    """
+    [(alias, get_stats())] de las conexiones configuradas con pool de psycopg.
+    """
+    from django.db import connections
+
+    estadisticas = []
+    for alias in connections:
+        conexion = connections[alias]
+        if conexion.settings_dict.get("OPTIONS", {}).get("pool"):
+            estadisticas.append((alias, conexion.pool.get_stats()))
+    return estadisticas
+
+
+def _sonda_pool(estadistica, escala=1):
+    def leer():
+        return [((alias,), stats.get(estadistica, 0) / escala) for alias, stats in estadisticas_pools()]
+    return leer
+
+
+# (métrica, tipo, estadística de psycopg_pool, escala, ayuda)
+METRICAS_POOL = (
+    ("routines_db_pool_size", "gauge", "pool_size", 1, "Conexiones abiertas en el pool"),
+    ("routines_db_pool_available", "gauge", "pool_available", 1, "Conexiones libres en el pool"),
+    ("routines_db_pool_max", "gauge", "pool_max", 1, "Tamaño máximo del pool"),
+    ("routines_db_pool_waiting", "gauge", "requests_waiting", 1, "Hilos esperando una conexión"),
+    ("routines_db_pool_requests_total", "counter", "requests_num", 1, "Conexiones pedidas al pool"),
+    ("routines_db_pool_queued_total", "counter", "requests_queued", 1, "Pedidos que tuvieron que esperar"),
+    ("routines_db_pool_timeouts_total", "counter", "requests_errors", 1, "Pedidos que agotaron el timeout"),
+    ("routines_db_pool_wait_seconds_total", "counter", "requests_wait_ms", 1000, "Tiempo esperando una conexión"),
+    ("routines_db_pool_usage_seconds_total", "counter", "usage_ms", 1000, "Tiempo con conexiones prestadas"),
+    ("routines_db_pool_connect_seconds_total", "counter", "connections_ms", 1000, "Tiempo abriendo conexiones nuevas"),
+)
+for nombre, tipo, estadistica, escala, ayuda in METRICAS_POOL:
+    Gauge(nombre, ayuda, ("alias",), _sonda_pool(estadistica, escala), tipo=tipo)
+
+# Tiempos de la petición en curso, para la cabecera Server-Timing
+_tiempos = contextvars.ContextVar("tiempos_peticion", default=None)
+
+
+def iniciar_peticion():
+    return _tiempos.set([])
+
+
+def terminar_peticion(token):
+    tiempos = _tiempos.get()
+    _tiempos.reset(token)
+    return tiempos or []
+
+
+@contextmanager
+def etapa(nombre, **etiquetas):
+    """
+    Mide una etapa de la generación. Las etiquetas pueden completarse dentro
+    del bloque (p. ej. de dónde salieron los ejercicios):
+
+        with etapa("ejercicios", muscle=m) as e:
+            ...
+            e["source"] = "catalogo"
+    """
+    inicio = time.perf_counter()
+    try:
+        yield etiquetas
+    finally:
+        duracion = time.perf_counter() - inicio
+        ETAPAS.observe(duracion, stage=nombre, **etiquetas)
+        tiempos = _tiempos.get()
+        if tiempos is not None:
+            detalle = " ".join(str(v) for v in etiquetas.values() if v)
+            tiempos.append((nombre, duracion, detalle))
+
+
+def server_timing(tiempos, consultas=None, tiempo_db=None):
+    """
+    Valor de la cabecera Server-Timing para los tiempos de una petición.
+    """
+    partes = []
+    for nombre, duracion, detalle in tiempos:
+        parte = f"{nombre};dur={duracion * 1000:.1f}"
+        if detalle:
+            parte += f';desc="{detalle}"'
+        partes.append(parte)
+    if consultas is not None:
+        partes.append(f'db;dur={tiempo_db * 1000:.1f};desc="{consultas} consultas"')
+    return ", ".join(partes)
@@ -0,0 +1,80 @@
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.db import connection
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import (
+    CONSULTAS_DB,
+    PETICIONES,
+    iniciar_peticion,
+    server_timing,
+    terminar_peticion,
+)
+
+
+class ContadorConsultas:
+    """
+    execute_wrapper que cuenta las consultas de la petición y su tiempo total.
+    """
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.tiempo += time.perf_counter() - inicio
+
+
+def _registrar(request, response, inicio, tiempos, contador):
+    match = getattr(request, "resolver_match", None)
+    vista = match.url_name if match and match.url_name else "sin_ruta"
+    if vista == "metrics":
+        return response
+
+    PETICIONES.observe(
+        time.perf_counter() - inicio,
+        view=vista,
+        method=request.method,
+        status=response.status_code,
+    )
+    CONSULTAS_DB.observe(contador.consultas, view=vista)
+    response["Server-Timing"] = server_timing(tiempos, contador.consultas, contador.tiempo)
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Mide cada petición: duración por vista, consultas a la DB y los tiempos
+    por etapa (metrics.etapa) en la cabecera Server-Timing.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            inicio = time.perf_counter()
+            token = iniciar_peticion()
+            contador = ContadorConsultas()
+            try:
+                with connection.execute_wrapper(contador):
+                    response = await get_response(request)
+            finally:
+                tiempos = terminar_peticion(token)
+            return _registrar(request, response, inicio, tiempos, contador)
+    else:
+        def middleware(request):
+            inicio = time.perf_counter()
+            token = iniciar_peticion()
+            contador = ContadorConsultas()
+            try:
+                with connection.execute_wrapper(contador):
+                    response = get_response(request)
+            finally:
+                tiempos = terminar_peticion(token)
+            return _registrar(request, response, inicio, tiempos, contador)
+
+    return middleware
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-17 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diarutina',
+            index=models.Index(fields=['rutina', 'dia'], name='diarutina_rutina_dia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rutina',
+            index=models.Index(fields=['user_id', '-created_at', '-id'], name='rutina_user_created_idx'),
+        ),
+    ]
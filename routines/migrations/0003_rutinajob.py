@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 04:02
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0002_rutina_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutinaJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('user_id', models.IntegerField()),
+                ('token', models.TextField(blank=True, default='')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('rutina', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='routines.rutina')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'created_at'], name='rutinajob_estado_created_idx')],
+            },
+        ),
+    ]
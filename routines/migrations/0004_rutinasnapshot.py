@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 04:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0003_rutinajob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutinaSnapshot',
+            fields=[
+                ('rutina', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='routines.rutina')),
+                ('detalle', models.TextField()),
+                ('por_dias', models.TextField()),
+                ('etag', models.CharField(max_length=64)),
+            ],
+        ),
+    ]
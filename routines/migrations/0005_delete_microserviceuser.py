@@ -0,0 +1,16 @@
+# Generated by Django 6.0 on 2026-10-17 03:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0004_rutinasnapshot'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='MicroserviceUser',
+        ),
+    ]
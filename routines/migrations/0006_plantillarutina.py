@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-17 04:05
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0005_delete_microserviceuser'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantillaRutina',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('goal', models.CharField(choices=[('ganar_musculo', 'Ganar músculo'), ('perder_peso', 'Perder peso'), ('tonificar', 'Tonificar'), ('mantener_forma', 'Mantener forma')], max_length=30)),
+                ('experience', models.CharField(choices=[('principiante', 'Principiante'), ('intermedio', 'Intermedio'), ('avanzado', 'Avanzado')], max_length=20)),
+                ('contenido', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['goal', 'experience', 'created_at'], name='plantilla_perfil_idx')],
+            },
+        ),
+    ]
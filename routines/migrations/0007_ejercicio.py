@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-17 04:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0006_plantillarutina'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ejercicio',
+            fields=[
+                ('id', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('muscle_group', models.CharField(max_length=100)),
+                ('difficulty', models.CharField(max_length=100)),
+                ('equipment', models.CharField(max_length=100)),
+                ('image_url', models.URLField(blank=True, max_length=500, null=True)),
+            ],
+        ),
+        # La columna ejercicio_id pasa a ser la FK: la actual se renombra mientras se copian los datos
+        migrations.RenameField(
+            model_name='diaejercicio',
+            old_name='ejercicio_id',
+            new_name='ejercicio_externo',
+        ),
+        # Nulables hasta que se eliminan en 0009, para poder deshacer la migración con datos
+        migrations.AlterField(
+            model_name='diaejercicio',
+            name='ejercicio_externo',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AlterField(
+            model_name='diaejercicio',
+            name='name',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AlterField(
+            model_name='diaejercicio',
+            name='muscle_group',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='diaejercicio',
+            name='difficulty',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='diaejercicio',
+            name='equipment',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='diaejercicio',
+            name='ejercicio',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='routines.ejercicio'),
+        ),
+    ]
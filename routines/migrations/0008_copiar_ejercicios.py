@@ -0,0 +1,74 @@
+# Generated by Django 6.0 on 2026-10-17 04:40
+
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery
+
+CAMPOS = ["name", "muscle_group", "difficulty", "equipment", "image_url"]
+LOTE = 5000
+
+
+def copiar_ejercicios(apps, schema_editor):
+    """
+    Un Ejercicio por cada ejercicio_id distinto (con los datos de cualquiera
+    de sus filas) y la FK de cada DiaEjercicio apuntando a él.
+    """
+    DiaEjercicio = apps.get_model("routines", "DiaEjercicio")
+    Ejercicio = apps.get_model("routines", "Ejercicio")
+
+    filas = (
+        DiaEjercicio.objects
+        .values_list("ejercicio_externo", *CAMPOS)
+        .order_by("ejercicio_externo")
+        .distinct()
+    )
+    lote = []
+    for ejercicio_id, *datos in filas.iterator(chunk_size=LOTE):
+        lote.append(Ejercicio(id=ejercicio_id, **dict(zip(CAMPOS, datos))))
+        if len(lote) >= LOTE:
+            Ejercicio.objects.bulk_create(lote, ignore_conflicts=True)
+            lote = []
+    Ejercicio.objects.bulk_create(lote, ignore_conflicts=True)
+
+    for ids in lotes_por_pk(DiaEjercicio):
+        DiaEjercicio.objects.filter(pk__in=ids).update(ejercicio_id=F("ejercicio_externo"))
+
+
+def restaurar_datos(apps, schema_editor):
+    DiaEjercicio = apps.get_model("routines", "DiaEjercicio")
+    Ejercicio = apps.get_model("routines", "Ejercicio")
+
+    datos = {
+        c: Subquery(Ejercicio.objects.filter(id=OuterRef("ejercicio_id")).values(c)[:1])
+        for c in CAMPOS
+    }
+    for ids in lotes_por_pk(DiaEjercicio):
+        DiaEjercicio.objects.filter(pk__in=ids).update(ejercicio_externo=F("ejercicio_id"), **datos)
+
+
+def lotes_por_pk(modelo):
+    """
+    Pks de `modelo` en lotes de LOTE, recorriendo el índice de la pk (keyset)
+    para que cada UPDATE toque pocas filas y se confirme por separado.
+    """
+    filas = modelo.objects.order_by("pk").values_list("pk", flat=True)
+    ultimo = None
+    while True:
+        lote = list((filas if ultimo is None else filas.filter(pk__gt=ultimo))[:LOTE])
+        if not lote:
+            return
+        yield lote
+        ultimo = lote[-1]
+
+
+class Migration(migrations.Migration):
+    # Tabla de millones de filas: cada lote se confirma por separado en vez de
+    # una sola transacción larga. Si se interrumpe puede volver a correrse.
+    atomic = False
+
+    dependencies = [
+        ('routines', '0007_ejercicio'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_ejercicios, restaurar_datos),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 04:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0008_copiar_ejercicios'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='diaejercicio',
+            name='ejercicio',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='routines.ejercicio'),
+        ),
+        migrations.RemoveField(
+            model_name='diaejercicio',
+            name='ejercicio_externo',
+        ),
+        migrations.RemoveField(
+            model_name='diaejercicio',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='diaejercicio',
+            name='muscle_group',
+        ),
+        migrations.RemoveField(
+            model_name='diaejercicio',
+            name='difficulty',
+        ),
+        migrations.RemoveField(
+            model_name='diaejercicio',
+            name='equipment',
+        ),
+        migrations.RemoveField(
+            model_name='diaejercicio',
+            name='image_url',
+        ),
+    ]
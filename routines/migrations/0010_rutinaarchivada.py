@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0009_diaejercicio_solo_fk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutinaArchivada',
+            fields=[
+                ('rutina_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('user_id', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('detalle', models.TextField()),
+                ('por_dias', models.TextField()),
+                ('etag', models.CharField(max_length=64)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', '-created_at'], name='archivada_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0010_rutinaarchivada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+                ('clave', models.CharField(max_length=255)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('respuesta', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'clave'), name='idempotencia_user_clave_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0011_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claveidempotencia',
+            index=models.Index(fields=['created_at'], name='idempotencia_created_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-17 19:20
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def cerrar_jobs_sin_perfil(apps, schema_editor):
+    """
+    Los jobs encolados antes de guardar el perfil solo tenían el JWT, que
+    esta migración borra: se cierran como fallidos para que se vuelvan a pedir.
+    """
+    RutinaJob = apps.get_model("routines", "RutinaJob")
+    RutinaJob.objects.filter(estado__in=["pendiente", "en_proceso"]).update(
+        estado="fallido",
+        error="Job encolado con una versión anterior; vuelve a solicitar la rutina",
+        finished_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0012_claveidempotencia_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rutinajob',
+            name='experience',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='rutinajob',
+            name='goal',
+            field=models.CharField(default='', max_length=30),
+            preserve_default=False,
+        ),
+        migrations.RunPython(cerrar_jobs_sin_perfil, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='rutinajob',
+            name='token',
+        ),
+    ]
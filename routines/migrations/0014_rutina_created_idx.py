@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routines', '0013_rutinajob_perfil'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rutina',
+            index=models.Index(fields=['created_at', 'id'], name='rutina_created_idx'),
+        ),
+    ]
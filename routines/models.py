@@ -1,12 +1,36 @@
 from django.db import models
+from django.db.models import Case, When, Prefetch
 import uuid
 
+
+class RutinaQuerySet(models.QuerySet):
+    def con_detalles(self):
+        """
+        Precarga días (en orden de la semana) y ejercicios: serializar
+        cualquier número de rutinas cuesta siempre 3 consultas.
+        """
+        return self.prefetch_related(
+            Prefetch("dias", queryset=DiaRutina.objects.order_by(orden_semana())),
+            Prefetch("dias__detalles", queryset=DiaEjercicio.objects.select_related("ejercicio")),
+        )
+
+
 class Rutina(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user_id = models.IntegerField()  # id que viene en el JWT
     created_at = models.DateTimeField(auto_now_add=True)
     duracion_minutos = models.PositiveIntegerField(default=0)
 
+    objects = RutinaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Última rutina / historial de un usuario
+            models.Index(fields=["user_id", "-created_at", "-id"], name="rutina_user_created_idx"),
+            # Archivado: rutinas anteriores a una fecha, recorridas en orden
+            models.Index(fields=["created_at", "id"], name="rutina_created_idx"),
+        ]
+
     def __str__(self):
         return f"Rutina {self.id} - user {self.user_id} - {self.created_at.date()}"
 
@@ -32,24 +56,203 @@ class DiaRutina(models.Model):
     musculo = models.CharField(max_length=30, choices=MUSCULOS)
     nombre = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["rutina", "dia"], name="diarutina_rutina_dia_idx"),
+        ]
+
     def __str__(self):
         return f"{self.dia} - {self.musculo}"
 
 
-class DiaEjercicio(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    dia = models.ForeignKey(DiaRutina, on_delete=models.CASCADE, related_name="detalles")
+def orden_semana():
+    """
+    Expresión para ordenar DiaRutina de lunes a domingo.
+    """
+    return Case(
+        *[When(dia=valor, then=i) for i, (valor, _) in enumerate(DiaRutina.DIAS)],
+        output_field=models.IntegerField(),
+    )
 
-    ejercicio_id = models.CharField(max_length=200)
+
+class Ejercicio(models.Model):
+    """
+    Copia local de un ejercicio del MS de Ejercicios, compartida por todas
+    las rutinas que lo usan. Se inserta la primera vez que una rutina lo usa
+    y no se modifica después, para que las rutinas ya guardadas no cambien.
+    """
+    id = models.CharField(primary_key=True, max_length=200)  # id en el MS de Ejercicios
     name = models.CharField(max_length=200)
     muscle_group = models.CharField(max_length=100)
     difficulty = models.CharField(max_length=100)
     equipment = models.CharField(max_length=100)
     image_url = models.URLField(max_length=500, null=True, blank=True)
 
+    def __str__(self):
+        return self.name
+
+
+class DiaEjercicio(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    dia = models.ForeignKey(DiaRutina, on_delete=models.CASCADE, related_name="detalles")
+
+    # Sin índice: nunca se busca por ejercicio y es la tabla más grande
+    ejercicio = models.ForeignKey(Ejercicio, on_delete=models.PROTECT, related_name="+", db_index=False)
+
     series = models.PositiveSmallIntegerField()
     reps = models.PositiveSmallIntegerField()
     rest_seconds = models.PositiveIntegerField(default=60)
 
+    # Datos del ejercicio como antes vivían en la fila
+    @property
+    def name(self):
+        return self.ejercicio.name
+
+    @property
+    def muscle_group(self):
+        return self.ejercicio.muscle_group
+
+    @property
+    def difficulty(self):
+        return self.ejercicio.difficulty
+
+    @property
+    def equipment(self):
+        return self.ejercicio.equipment
+
+    @property
+    def image_url(self):
+        return self.ejercicio.image_url
+
+    def __str__(self):
+        return f"{self.name} - {self.series}x{self.reps}"
+
+class RutinaJob(models.Model):
+    """
+    Generación de rutina encolada (modo job de /routines/generate/).
+    Los workers la reclaman con SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADO = "completado"
+    FALLIDO = "fallido"
+    ESTADOS = [
+        (PENDIENTE, "Pendiente"),
+        (EN_PROCESO, "En proceso"),
+        (COMPLETADO, "Completado"),
+        (FALLIDO, "Fallido"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_id = models.IntegerField()
+    experience = models.CharField(max_length=20)  # perfil resuelto al encolar
+    goal = models.CharField(max_length=30)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    rutina = models.ForeignKey(Rutina, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["estado", "created_at"], name="rutinajob_estado_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - user {self.user_id} - {self.estado}"
+
+
+class RutinaSnapshot(models.Model):
+    """
+    Documentos JSON ya renderizados de una rutina. Una rutina no cambia
+    después de generarse, así que se escriben una vez y se sirven tal cual.
+    """
+    rutina = models.OneToOneField(Rutina, on_delete=models.CASCADE, primary_key=True, related_name="snapshot")
+    detalle = models.TextField()  # forma de RutinaSerializer (GET /<id>/)
+    por_dias = models.TextField()  # forma de GET /<id>/days/
+    etag = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f"Snapshot {self.rutina_id}"
+
+
+class PlantillaRutina(models.Model):
+    """
+    Variante de rutina ya armada para un perfil (objetivo, experiencia). Se
+    rellenan fuera de la petición y la generación solo copia una al usuario.
+    `contenido` guarda los días con sus ejercicios en el orden de la semana.
+    """
+    OBJETIVOS = [
+        ("ganar_musculo", "Ganar músculo"),
+        ("perder_peso", "Perder peso"),
+        ("tonificar", "Tonificar"),
+        ("mantener_forma", "Mantener forma"),
+    ]
+    EXPERIENCIAS = [
+        ("principiante", "Principiante"),
+        ("intermedio", "Intermedio"),
+        ("avanzado", "Avanzado"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    goal = models.CharField(max_length=30, choices=OBJETIVOS)
+    experience = models.CharField(max_length=20, choices=EXPERIENCIAS)
+    contenido = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["goal", "experience", "created_at"], name="plantilla_perfil_idx"),
+        ]
+
+    def __str__(self):
+        return f"Plantilla {self.goal}/{self.experience} - {self.id}"
+
+
+class RutinaArchivada(models.Model):
+    """
+    Rutina antigua sacada de las tablas calientes (archive_routines): una sola
+    fila con los documentos ya renderizados de su snapshot, en lugar de la
+    rutina, sus días y sus ejercicios.
+    """
+    rutina_id = models.UUIDField(primary_key=True)
+    user_id = models.IntegerField()
+    created_at = models.DateTimeField()
+    detalle = models.TextField()
+    por_dias = models.TextField()
+    etag = models.CharField(max_length=64)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_id", "-created_at"], name="archivada_user_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"Rutina archivada {self.rutina_id} - user {self.user_id}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de /routines/generate/ para un header Idempotency-Key.
+    Mientras la generación está en curso `status_code` es null; al terminar
+    se guarda la respuesta y los reintentos con la misma clave la reciben tal
+    cual, sin volver a generar.
+    """
+    user_id = models.IntegerField()
+    clave = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "clave"], name="idempotencia_user_clave_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["created_at"], name="idempotencia_created_idx"),  # purga
+        ]
+
     def __str__(self):
-        return f"{self.name} - {self.series}x{self.reps}"
\ No newline at end of file
+        return f"Idempotency-Key {self.clave} - user {self.user_id}"
@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class RutinaCursorPagination(CursorPagination):
+    """
+    Paginación por cursor sobre (created_at, id), de la más reciente a la más antigua.
+    """
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def is_requested(self, request):
+        """
+        Solo se pagina si el cliente lo pide, para no romper a quien espera la lista completa.
+        """
+        return (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class IsBatchOperator(BasePermission):
+    """
+    Solo los usuarios listados en ROUTINES_BATCH_OPERATOR_IDS pueden generar rutinas en lote.
+    """
+    message = "No tienes permiso para generar rutinas en lote."
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(
+            user and user.is_authenticated
+            and user.id in getattr(settings, "ROUTINES_BATCH_OPERATOR_IDS", ())
+        )
@@ -0,0 +1,82 @@
+import random
+from array import array
+
+# Intentos de muestreo al azar antes de recorrer el bucket completo
+INTENTOS_MUESTREO = 8
+
+
+class PoolEjercicios:
+    """
+    Candidatos de un músculo: la lista tal como llegó del MS de Ejercicios y
+    arreglos de índices sobre ella agrupados por equipo. Se arma una vez y se
+    reutiliza para todas las rutinas que salen del mismo pool.
+    """
+
+    def __init__(self, ejercicios):
+        self.ejercicios = ejercicios
+        self.por_equipo = {}
+        for i, ex in enumerate(ejercicios):
+            equipo = ex.get("equipment_display") or ""
+            self.por_equipo.setdefault(equipo, array("I")).append(i)
+
+
+class SelectorEjercicios:
+    """
+    Elige los ejercicios de la semana en O(k) por día: muestrea índices al
+    azar en vez de barajar toda la lista, reparte la selección entre equipos
+    distintos (round-robin) y no repite ejercicios entre días mientras el
+    catálogo alcance. Con `seed` la selección es reproducible.
+    """
+
+    def __init__(self, ejercicios_por_musculo, seed=None, rng=None):
+        self.rng = rng or random.Random(seed)
+        self.pools = {m: PoolEjercicios(list(e)) for m, e in ejercicios_por_musculo.items()}
+
+    def semana(self, split, por_dia):
+        """
+        {dia: [ejercicios]} para cada día del split.
+        """
+        usados = set()
+        return {dia: self.dia(musculo, por_dia, usados) for dia, musculo in split.items()}
+
+    def dia(self, musculo, k, usados):
+        pool = self.pools[musculo]
+        elegidos = self._round_robin(pool, k, usados)
+        if len(elegidos) < k:
+            # El catálogo no alcanza sin repetir: se completa con ejercicios de
+            # otros días, pero nunca se repite dentro del mismo día
+            del_dia = {pool.ejercicios[i]["id"] for i in elegidos}
+            elegidos += self._round_robin(pool, k - len(elegidos), del_dia)
+        seleccion = [pool.ejercicios[i] for i in elegidos]
+        usados.update(ex["id"] for ex in seleccion)
+        return seleccion
+
+    def _round_robin(self, pool, k, excluidos):
+        equipos = list(pool.por_equipo)
+        self.rng.shuffle(equipos)
+        elegidos = []
+        excluidos = set(excluidos)
+        while len(elegidos) < k and equipos:
+            for equipo in list(equipos):
+                if len(elegidos) == k:
+                    break
+                i = self._tomar(pool, pool.por_equipo[equipo], excluidos)
+                if i is None:
+                    equipos.remove(equipo)
+                    continue
+                elegidos.append(i)
+                excluidos.add(pool.ejercicios[i]["id"])
+        return elegidos
+
+    def _tomar(self, pool, indices, excluidos):
+        """
+        Un índice al azar del bucket cuyo ejercicio no esté excluido, o None.
+        Mientras quedan libres la mayoría basta con pocos intentos; solo si
+        fallan se filtra el bucket completo.
+        """
+        for _ in range(min(INTENTOS_MUESTREO, len(indices))):
+            i = indices[self.rng.randrange(len(indices))]
+            if pool.ejercicios[i]["id"] not in excluidos:
+                return i
+        libres = [i for i in indices if pool.ejercicios[i]["id"] not in excluidos]
+        return self.rng.choice(libres) if libres else None
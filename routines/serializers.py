@@ -1,19 +1,50 @@
 from rest_framework import serializers
-from .models import Rutina, DiaRutina, DiaEjercicio
+from .models import Rutina, DiaRutina, DiaEjercicio, RutinaJob
 
 class DiaEjercicioSerializer(serializers.ModelSerializer):
+    # name e image_url vienen del Ejercicio (propiedades de DiaEjercicio)
+    ejercicio_id = serializers.CharField()
+    name = serializers.CharField()
+    image_url = serializers.URLField(allow_null=True)
     class Meta:
         model = DiaEjercicio
         fields = ["ejercicio_id", "name", "image_url", "series", "reps", "rest_seconds"]
 
-class DiaRutinaSerializer(serializers.ModelSerializer):
-    detalles = DiaEjercicioSerializer(many=True)
+class DiaRutinaBaseSerializer(serializers.ModelSerializer):
     class Meta:
         model = DiaRutina
-        fields = ["dia", "musculo", "nombre", "detalles"]
+        fields = ["dia", "musculo", "nombre"]
+
+class DiaRutinaSerializer(DiaRutinaBaseSerializer):
+    detalles = DiaEjercicioSerializer(many=True)
+    class Meta(DiaRutinaBaseSerializer.Meta):
+        fields = DiaRutinaBaseSerializer.Meta.fields + ["detalles"]
+
+class RutinaBaseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Rutina
+        fields = ["id", "user_id", "created_at", "duracion_minutos"]
 
-class RutinaSerializer(serializers.ModelSerializer):
+class RutinaSerializer(RutinaBaseSerializer):
     dias = DiaRutinaSerializer(many=True)
+    class Meta(RutinaBaseSerializer.Meta):
+        fields = RutinaBaseSerializer.Meta.fields + ["dias"]
+
+class RutinaResumenSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rutina
-        fields = ["id", "user_id", "created_at", "duracion_minutos", "dias"]
+        fields = ["id", "created_at", "duracion_minutos"]
+
+class RutinaJobSerializer(serializers.ModelSerializer):
+    rutina_id = serializers.UUIDField(read_only=True)
+    class Meta:
+        model = RutinaJob
+        fields = ["id", "estado", "rutina_id", "error", "created_at", "started_at", "finished_at"]
+
+class PerfilLoteSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    experience = serializers.ChoiceField(choices=["principiante", "intermedio", "avanzado"])
+    goal = serializers.CharField()
+
+class GenerarLoteSerializer(serializers.Serializer):
+    profiles = PerfilLoteSerializer(many=True, allow_empty=False)
@@ -0,0 +1,415 @@
+import logging
+import random
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .cache import (
+    fijar_rutina_activa,
+    obtener_perfil,
+    aobtener_perfil,
+    obtener_plantillas,
+    invalidar_plantillas,
+)
+from .concurrency import SingleFlight, AsyncSingleFlight
+from .metrics import etapa
+from .models import Rutina, DiaRutina, DiaEjercicio, Ejercicio, RutinaSnapshot, PlantillaRutina
+from .selection import SelectorEjercicios
+from .snapshots import nuevo_snapshot
+from .utils import (
+    calcular_duracion_total,
+    calcular_series_reps_rest,
+    fetch_exercises_for_split,
+    fetch_profile,
+    afetch_exercises_for_split,
+    afetch_profile,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPLIT = {
+    "lunes": "pierna",
+    "martes": "pecho",
+    "miercoles": "espalda",
+    "jueves": "brazos",
+    "viernes": "cuerpo_completo"
+}
+
+NOMBRES_RUTINA_DIA = {
+    "pierna": [
+        "Piernas de Acero",
+        "Fuerza Inferior",
+    ],
+    "pecho": [
+        "Empuje Superior",
+        "Tono y Volumen"
+    ],
+    "espalda": [
+        "Espalda Definida",
+        "Fortaleza Dorsal"
+    ],
+    "brazos": [
+        "Brazos de Acero",
+        "Esculpe tus Brazos"
+    ],
+    "cuerpo_completo": [
+        "Entrenamiento Total",
+        "Cuerpo Completo",
+    ]
+}
+
+EJERCICIOS_POR_DIA = 5
+
+# Datos de cada ejercicio que se guardan en la tabla Ejercicio
+CAMPOS_EJERCICIO = ["name", "muscle_group", "difficulty", "equipment", "image_url"]
+
+# Campos de DiaEjercicio que se copian de una plantilla
+CAMPOS_EJERCICIO_PLANTILLA = ["ejercicio_id", *CAMPOS_EJERCICIO, "series", "reps", "rest_seconds"]
+
+
+class RutinaEnMemoria:
+    """
+    Árbol Rutina -> DiaRutina -> DiaEjercicio construido sin tocar la DB.
+    Los UUID se generan en el cliente, así que las FK ya quedan resueltas.
+    """
+    def __init__(self, rutina):
+        self.rutina = rutina
+        self.dias = []
+        self.detalles = []
+
+    def por_dia(self):
+        """
+        [(DiaRutina, [DiaEjercicio])] en el orden en que se armaron.
+        """
+        detalles = {dia.id: [] for dia in self.dias}
+        for detalle in self.detalles:
+            detalles[detalle.dia_id].append(detalle)
+        return [(dia, detalles[dia.id]) for dia in self.dias]
+
+
+def construir_rutina(user_id, duracion_minutos, goal, difficulty, ejercicios_por_musculo, split=DEFAULT_SPLIT,
+                     selector=None):
+    """
+    Elige los ejercicios de cada día y arma la rutina completa en memoria.
+    Quien genera muchas rutinas del mismo pool puede pasar su `selector`
+    para no reconstruir los índices en cada una.
+    """
+    arbol = RutinaEnMemoria(Rutina(user_id=user_id, duracion_minutos=duracion_minutos))
+    series, reps, rest = calcular_series_reps_rest(goal, difficulty)
+    if selector is None:
+        selector = SelectorEjercicios(ejercicios_por_musculo)
+
+    # Sin repetir ejercicios en la semana y variando el equipo de cada día
+    semana = selector.semana(split, EJERCICIOS_POR_DIA)
+
+    for dia_nombre, musculo in split.items():
+        ejercicios = semana[dia_nombre]
+        nombre_dia = selector.rng.choice(NOMBRES_RUTINA_DIA.get(musculo, ["Día de Entrenamiento"]))
+
+        dia = DiaRutina(
+            rutina=arbol.rutina,
+            dia=dia_nombre,
+            musculo=musculo,
+            nombre=nombre_dia,
+        )
+        arbol.dias.append(dia)
+
+        for ex in ejercicios:
+            arbol.detalles.append(DiaEjercicio(
+                dia=dia,
+                ejercicio=Ejercicio(
+                    id=ex["id"],
+                    name=ex["name"],
+                    muscle_group=ex["muscle_group_display"],
+                    difficulty=ex["difficulty_display"],
+                    equipment=ex["equipment_display"],
+                    image_url=ex["image_url"],
+                ),
+                series=series,
+                reps=reps,
+                rest_seconds=rest
+            ))
+
+    return arbol
+
+
+def plantilla_desde_arbol(arbol, goal, experience):
+    """
+    PlantillaRutina con los días y ejercicios de un árbol armado en memoria.
+    """
+    return PlantillaRutina(goal=goal, experience=experience, contenido={
+        "dias": [
+            {
+                "dia": dia.dia,
+                "musculo": dia.musculo,
+                "nombre": dia.nombre,
+                "detalles": [{c: getattr(d, c) for c in CAMPOS_EJERCICIO_PLANTILLA} for d in detalles],
+            }
+            for dia, detalles in arbol.por_dia()
+        ],
+    })
+
+
+def clonar_plantilla(user_id, contenido, experience):
+    """
+    Árbol nuevo para el usuario con los días y ejercicios de una plantilla.
+    La duración se sortea por usuario como en la generación normal.
+    """
+    arbol = RutinaEnMemoria(Rutina(user_id=user_id, duracion_minutos=calcular_duracion_total(experience)))
+    for d in contenido["dias"]:
+        dia = DiaRutina(rutina=arbol.rutina, dia=d["dia"], musculo=d["musculo"], nombre=d["nombre"])
+        arbol.dias.append(dia)
+        for detalle in d["detalles"]:
+            arbol.detalles.append(DiaEjercicio(
+                dia=dia,
+                ejercicio=Ejercicio(id=detalle["ejercicio_id"], **{c: detalle[c] for c in CAMPOS_EJERCICIO}),
+                series=detalle["series"],
+                reps=detalle["reps"],
+                rest_seconds=detalle["rest_seconds"],
+            ))
+    return arbol
+
+
+def plantillas_perfil(goal, experience):
+    return obtener_plantillas(goal, experience, lambda: list(
+        PlantillaRutina.objects.filter(goal=goal, experience=experience).values_list("contenido", flat=True)
+    ))
+
+
+def rellenar_plantillas(token, por_perfil=20, max_age=None):
+    """
+    Completa hasta `por_perfil` plantillas por cada (objetivo, experiencia).
+    Con `max_age` (segundos) las más viejas se reemplazan por variantes
+    nuevas, tomadas del catálogo actual; si el MS de Ejercicios falla para
+    una experiencia, sus plantillas viejas se conservan.
+    Devuelve (plantillas creadas, [(experiencia, error)]).
+    """
+    plantillas = PlantillaRutina.objects.all()
+    vencidas = plantillas.none()
+    if max_age:
+        limite = timezone.now() - timedelta(seconds=max_age)
+        vencidas = plantillas.filter(created_at__lt=limite)
+        plantillas = plantillas.filter(created_at__gte=limite)
+    existentes = {
+        (p["goal"], p["experience"]): p["n"]
+        for p in plantillas.values("goal", "experience").annotate(n=Count("id"))
+    }
+
+    nuevas = []
+    errores = []
+    refrescadas = []
+    for experiencia, _ in PlantillaRutina.EXPERIENCIAS:
+        faltan = {
+            goal: por_perfil - existentes.get((goal, experiencia), 0)
+            for goal, _ in PlantillaRutina.OBJETIVOS
+        }
+        if all(n <= 0 for n in faltan.values()):
+            continue
+        try:
+            pool = fetch_exercises_for_split(DEFAULT_SPLIT, experiencia, token)
+        except Exception as e:
+            errores.append((experiencia, str(e)))
+            continue
+
+        refrescadas.append(experiencia)
+        selector = SelectorEjercicios(pool)
+        for goal, n in faltan.items():
+            for _ in range(n):
+                arbol = construir_rutina(None, 0, goal, experiencia, pool, selector=selector)
+                nuevas.append(plantilla_desde_arbol(arbol, goal, experiencia))
+
+    with transaction.atomic():
+        PlantillaRutina.objects.bulk_create(nuevas)
+        vencidas.filter(experience__in=refrescadas).delete()
+
+    invalidar_plantillas([(g, e) for g, _ in PlantillaRutina.OBJETIVOS for e, _ in PlantillaRutina.EXPERIENCIAS])
+    return nuevas, errores
+
+
+def guardar_rutinas(arboles):
+    """
+    Inserta varios árboles en una sola transacción y con un número fijo de
+    consultas (una por tabla), sin importar cuántas rutinas, días o
+    ejercicios tengan. Los ejercicios que aún no están en la tabla Ejercicio
+    se insertan; los que ya están no se modifican (cambiarlos alteraría las
+    rutinas existentes) y la rutina nueva usa sus datos guardados, así el
+    snapshot coincide con lo que devuelve la DB. En la misma transacción se
+    guardan los snapshots JSON que sirven las lecturas.
+    """
+    ejercicios = {d.ejercicio.id: d.ejercicio for a in arboles for d in a.detalles}
+    with transaction.atomic():
+        with etapa("db_catalogo"):
+            guardados = Ejercicio.objects.in_bulk(list(ejercicios))
+            Ejercicio.objects.bulk_create(
+                [e for id_, e in ejercicios.items() if id_ not in guardados],
+                ignore_conflicts=True,
+            )
+            for arbol in arboles:
+                for detalle in arbol.detalles:
+                    if detalle.ejercicio.id in guardados:
+                        detalle.ejercicio = guardados[detalle.ejercicio.id]
+        with etapa("db_rutinas"):
+            rutinas = Rutina.objects.bulk_create([a.rutina for a in arboles])
+        with etapa("db_dias"):
+            DiaRutina.objects.bulk_create([d for a in arboles for d in a.dias])
+        with etapa("db_ejercicios"):
+            DiaEjercicio.objects.bulk_create([d for a in arboles for d in a.detalles])
+
+        # created_at ya quedó asignado por el INSERT
+        with etapa("db_snapshots"):
+            for arbol in arboles:
+                arbol.rutina.snapshot = nuevo_snapshot(arbol.rutina, arbol.por_dia())
+            RutinaSnapshot.objects.bulk_create([r.snapshot for r in rutinas])
+
+        # La última rutina de cada usuario pasa a ser la activa
+        activas = {r.user_id: r.id for r in rutinas}
+        transaction.on_commit(lambda: [fijar_rutina_activa(u, r) for u, r in activas.items()])
+    return rutinas
+
+
+def guardar_rutina(arbol):
+    return guardar_rutinas([arbol])[0]
+
+
+async def aguardar_rutina(arbol):
+    """
+    guardar_rutina desde código async. Las transacciones no están disponibles
+    en el ORM async, así que la escritura atómica corre en un hilo.
+    """
+    return await sync_to_async(guardar_rutina)(arbol)
+
+
+def perfil_usuario(user_id, token):
+    """
+    Perfil del usuario desde MS Usuarios (cacheado por usuario).
+    """
+    with etapa("perfil", source="cache") as e:
+        def cargar():
+            e["source"] = "usuarios"
+            return fetch_profile(token)
+        return obtener_perfil(user_id, cargar)
+
+
+def generar_rutina(user_id, token, profile=None):
+    """
+    Pipeline completo: perfil -> ejercicios de todos los días -> rutina guardada.
+    Con `profile` ya resuelto (p. ej. al encolar un job) no se llama al MS
+    Usuarios y `token` solo se usa con el MS de Ejercicios.
+    Propaga PerfilNoDisponible, EjerciciosInsuficientes, TiempoAgotadoEjercicios
+    y CircuitoAbierto para que quien llame decida cómo reportarlos.
+    """
+    # 1. Obtener perfil desde MS Usuarios (cacheado por usuario)
+    if profile is None:
+        profile = perfil_usuario(user_id, token)
+
+    difficulty = profile["experience"]
+    goal = profile["goal"]
+    logger.debug("Generando rutina para %s: experiencia=%s objetivo=%s", user_id, difficulty, goal)
+
+    # 2. Si hay variantes listas para el perfil se copia una: no se llama al MS de Ejercicios
+    plantillas = plantillas_perfil(goal, difficulty)
+    if plantillas:
+        with etapa("seleccion", source="plantilla"):
+            arbol = clonar_plantilla(user_id, random.choice(plantillas), difficulty)
+    else:
+        # 2b. Obtener en paralelo los ejercicios de todos los días y armar la rutina en memoria
+        ejercicios_por_musculo = fetch_exercises_for_split(DEFAULT_SPLIT, difficulty, token)
+        total_duration = calcular_duracion_total(difficulty)
+        with etapa("seleccion"):
+            arbol = construir_rutina(user_id, total_duration, goal, difficulty, ejercicios_por_musculo)
+
+    # 3. Guardarla de una sola vez
+    rutina = guardar_rutina(arbol)
+    logger.info("Rutina %s generada para %s", rutina.id, user_id)
+    return rutina
+
+
+async def agenerar_rutina(user_id, token):
+    """
+    Versión async de generar_rutina (mismas excepciones).
+    """
+    with etapa("perfil", source="cache") as e:
+        def cargar():
+            e["source"] = "usuarios"
+            return afetch_profile(token)
+        profile = await aobtener_perfil(user_id, cargar)
+
+    difficulty = profile["experience"]
+    goal = profile["goal"]
+    logger.debug("Generando rutina para %s: experiencia=%s objetivo=%s", user_id, difficulty, goal)
+
+    plantillas = await sync_to_async(plantillas_perfil)(goal, difficulty)
+    if plantillas:
+        with etapa("seleccion", source="plantilla"):
+            arbol = clonar_plantilla(user_id, random.choice(plantillas), difficulty)
+    else:
+        ejercicios_por_musculo = await afetch_exercises_for_split(DEFAULT_SPLIT, difficulty, token)
+        total_duration = calcular_duracion_total(difficulty)
+        with etapa("seleccion"):
+            arbol = construir_rutina(user_id, total_duration, goal, difficulty, ejercicios_por_musculo)
+    rutina = await aguardar_rutina(arbol)
+    logger.info("Rutina %s generada para %s", rutina.id, user_id)
+    return rutina
+
+
+_generaciones_en_vuelo = SingleFlight()
+_generaciones_en_vuelo_async = AsyncSingleFlight()
+
+
+def generar_rutina_compartida(user_id, token):
+    """
+    generar_rutina coalescida por usuario: si ya hay una generación en curso
+    para `user_id` (doble toque, reintento del cliente) se espera esa misma y
+    se devuelve su rutina en lugar de generar otra.
+    """
+    return _generaciones_en_vuelo.do(user_id, lambda: generar_rutina(user_id, token))
+
+
+async def agenerar_rutina_compartida(user_id, token):
+    return await _generaciones_en_vuelo_async.do(user_id, lambda: agenerar_rutina(user_id, token))
+
+
+def generar_rutinas_lote(perfiles, token, chunk_size=500):
+    """
+    Genera rutinas para muchos usuarios a la vez. `perfiles` es una lista de
+    dicts con user_id, experience y goal.
+
+    Los ejercicios de cada par (músculo, experiencia) se piden una sola vez,
+    la selección se hace en memoria y se guarda en lotes de `chunk_size`
+    rutinas. Devuelve (creadas, errores): [(user_id, rutina)] y [(user_id, mensaje)].
+    """
+    pools = {}
+    errores = []
+    for experiencia in dict.fromkeys(p["experience"] for p in perfiles):
+        try:
+            pools[experiencia] = fetch_exercises_for_split(DEFAULT_SPLIT, experiencia, token)
+        except Exception as e:
+            pools[experiencia] = e
+
+    # Los índices de cada pool se arman una sola vez para todo el lote
+    selectores = {
+        experiencia: SelectorEjercicios(pool)
+        for experiencia, pool in pools.items() if not isinstance(pool, Exception)
+    }
+
+    arboles = []
+    for perfil in perfiles:
+        pool = pools[perfil["experience"]]
+        if isinstance(pool, Exception):
+            errores.append((perfil["user_id"], str(pool)))
+            continue
+        arboles.append(construir_rutina(
+            perfil["user_id"],
+            calcular_duracion_total(perfil["experience"]),
+            perfil["goal"],
+            perfil["experience"],
+            pool,
+            selector=selectores[perfil["experience"]],
+        ))
+
+    creadas = []
+    for i in range(0, len(arboles), chunk_size):
+        for rutina in guardar_rutinas(arboles[i:i + chunk_size]):
+            creadas.append((rutina.user_id, rutina))
+    return creadas, errores
@@ -0,0 +1,17 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .cache import invalidar_rutina_activa
+from .metrics import CONEXIONES_DB
+from .models import Rutina
+
+
+@receiver(post_delete, sender=Rutina)
+def invalidar_cache_rutina(sender, instance, **kwargs):
+    invalidar_rutina_activa(instance.user_id)
+
+
+@receiver(connection_created)
+def contar_conexion(sender, connection, **kwargs):
+    CONEXIONES_DB.inc(alias=connection.alias)
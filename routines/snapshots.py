@@ -0,0 +1,129 @@
+import hashlib
+
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+from .models import DiaRutina, Rutina, RutinaArchivada, RutinaSnapshot, orden_semana
+from .serializers import DiaEjercicioSerializer, DiaRutinaBaseSerializer, RutinaBaseSerializer
+
+# Columnas de la proyección con la que se arma un snapshot desde la DB
+COLUMNAS_RUTINA = ["rutina__" + c for c in RutinaBaseSerializer.Meta.fields]
+COLUMNAS_DIA = ["id"] + DiaRutinaBaseSerializer.Meta.fields
+RUTAS_DETALLE = {"name": "ejercicio__name", "image_url": "ejercicio__image_url"}
+COLUMNAS_DETALLE = ["detalles__" + RUTAS_DETALLE.get(c, c) for c in DiaEjercicioSerializer.Meta.fields]
+
+
+def documentos_rutina(rutina, dias):
+    """
+    Renderiza (detalle, por_dias) de una rutina. `dias` es una lista de
+    (día, [ejercicios]) en orden; días y ejercicios pueden ser instancias o
+    dicts con los campos de sus serializers, así sirve igual para un árbol
+    recién construido en memoria que para una proyección leída de la DB.
+    """
+    detalle = dict(RutinaBaseSerializer(rutina).data)
+    detalle["dias"] = []
+    por_dias = {}
+    for dia, ejercicios in dias:
+        base = DiaRutinaBaseSerializer(dia).data
+        detalles = DiaEjercicioSerializer(ejercicios, many=True).data
+        detalle["dias"].append({**base, "detalles": detalles})
+        por_dias[base["dia"]] = {"nombre": base["nombre"], "musculo": base["musculo"], "detalles": detalles}
+
+    renderer = JSONRenderer()
+    return (
+        renderer.render(detalle).decode(),
+        renderer.render({"id": str(rutina.id), "dias": por_dias}).decode(),
+    )
+
+
+def nuevo_snapshot(rutina, dias):
+    detalle, por_dias = documentos_rutina(rutina, dias)
+    etag = hashlib.sha1((detalle + por_dias).encode()).hexdigest()
+    return RutinaSnapshot(rutina=rutina, detalle=detalle, por_dias=por_dias, etag=etag)
+
+
+def proyeccion_rutina(rutina_id, user_id):
+    """
+    Rutina, días (de lunes a domingo) y ejercicios en una sola consulta
+    (días LEFT JOIN ejercicios) con solo las columnas que se renderizan.
+    Devuelve (Rutina, [(dict día, [dict ejercicio])]) o None.
+    """
+    filas = (
+        DiaRutina.objects
+        .filter(rutina_id=rutina_id, rutina__user_id=user_id)
+        .order_by(orden_semana(), "id")
+        .values_list(*COLUMNAS_RUTINA, *COLUMNAS_DIA, *COLUMNAS_DETALLE)
+    )
+
+    n_rutina, n_dia = len(COLUMNAS_RUTINA), len(COLUMNAS_DIA)
+    campos_dia = DiaRutinaBaseSerializer.Meta.fields
+    campos_detalle = DiaEjercicioSerializer.Meta.fields
+    rutina = None
+    dias = []
+    for fila in filas:
+        if rutina is None:
+            rutina = Rutina(**dict(zip(RutinaBaseSerializer.Meta.fields, fila[:n_rutina])))
+        dia = fila[n_rutina:n_rutina + n_dia]
+        if not dias or dias[-1][0] != dia[0]:
+            dias.append((dia[0], dict(zip(campos_dia, dia[1:])), []))
+        detalle = fila[n_rutina + n_dia:]
+        if detalle[0] is not None:  # día sin ejercicios (LEFT JOIN)
+            dias[-1][2].append(dict(zip(campos_detalle, detalle)))
+
+    if rutina is None:
+        # Una rutina sin días no aparece en el JOIN
+        rutina = Rutina.objects.filter(id=rutina_id, user_id=user_id).first()
+        if rutina is None:
+            return None
+    return rutina, [(dia, detalles) for _, dia, detalles in dias]
+
+
+def snapshot_desde_db(rutina, dias):
+    """
+    Crea el snapshot de una rutina anterior a los snapshots.
+    """
+    snapshot = nuevo_snapshot(rutina, dias)
+    RutinaSnapshot.objects.bulk_create([snapshot], ignore_conflicts=True)
+    return snapshot
+
+
+def obtener_snapshot(rutina_id, user_id, documento):
+    """
+    (cuerpo, etag) de uno de los documentos ("detalle" o "por_dias") de una
+    rutina del usuario, o None si no existe. Solo se lee esa columna.
+    Las rutinas anteriores a los snapshots lo generan en la primera lectura
+    y las archivadas se sirven desde RutinaArchivada.
+    """
+    fila = (
+        RutinaSnapshot.objects
+        .filter(rutina_id=rutina_id, rutina__user_id=user_id)
+        .values_list(documento, "etag")
+        .first()
+    )
+    if fila is None:
+        proyeccion = proyeccion_rutina(rutina_id, user_id)
+        if proyeccion is None:
+            return (
+                RutinaArchivada.objects
+                .filter(rutina_id=rutina_id, user_id=user_id)
+                .values_list(documento, "etag")
+                .first()
+            )
+        snapshot = snapshot_desde_db(*proyeccion)
+        fila = (getattr(snapshot, documento), snapshot.etag)
+    return fila
+
+
+def respuesta_snapshot(request, cuerpo, etag):
+    """
+    Devuelve el documento tal cual, o 304 si el cliente ya tiene esa versión.
+    """
+    etag = f'"{etag}"'
+    if_none_match = request.headers.get("If-None-Match", "")
+    etiquetas = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+    if etag in etiquetas or "*" in etiquetas:
+        respuesta = HttpResponseNotModified()
+    else:
+        respuesta = HttpResponse(cuerpo, content_type="application/json")
+    respuesta["ETag"] = etag
+    return respuesta
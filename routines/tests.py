@@ -1,3 +1,876 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .archive import archivar_rutinas
+from .authentication import MicroserviceJWTAuthentication, MicroserviceUser, tokens_verificados
+from .benchmarks import ServiciosFalsos
+from .cache import fijar_rutina_activa, obtener_rutina_activa
+from .catalog import ExerciseCatalog
+from .concurrency import AsyncSingleFlight
+from .idempotency import con_idempotencia
+from .clients import AsyncServiceClient, CircuitBreaker, CircuitoAbierto, ServiceClient, reiniciar_clientes
+from .jobs import reclamar_job, ejecutar_job
+from .models import ClaveIdempotencia, DiaEjercicio, DiaRutina, Ejercicio, PlantillaRutina, Rutina, RutinaArchivada, RutinaSnapshot
+from .selection import SelectorEjercicios
+from .serializers import RutinaSerializer
+from .utils import (
+    EjerciciosInsuficientes,
+    PerfilNoDisponible,
+    TiempoAgotadoEjercicios,
+    _quitar_acentos_nfd,
+    afetch_exercises_for_split,
+    exercise_catalog,
+    fetch_exercises_by_muscle,
+    fetch_exercises_for_split,
+    iter_json_array,
+    normalize_text,
+)
+from .services import DEFAULT_SPLIT, construir_rutina, generar_rutina_compartida, guardar_rutina, rellenar_plantillas
+
+
+def ejercicios_falsos(musculo, n=8):
+    return [
+        {
+            "id": f"{musculo}-{i}",
+            "name": f"Ejercicio {i}",
+            "muscle_group_display": musculo,
+            "difficulty_display": "Principiante",
+            "equipment_display": "Mancuernas",
+            "image_url": None,
+        }
+        for i in range(n)
+    ]
+
+
+def crear_rutina(user_id=1):
+    ejercicios = {m: ejercicios_falsos(m) for m in DEFAULT_SPLIT.values()}
+    return guardar_rutina(construir_rutina(user_id, 40, "ganar_musculo", "principiante", ejercicios))
+
+
+class CatalogStreamingTests(SimpleTestCase):
+    def test_iter_json_array_across_chunk_boundaries(self):
+        items = [{"id": i, "name": "Sentadilla búlgara", "tags": [i, 2.5, None]} for i in range(50)]
+        texto = json.dumps(items, ensure_ascii=False)
+        for tamano in (1, 7, 4096):
+            trozos = (texto[i:i + tamano] for i in range(0, len(texto), tamano))
+            self.assertEqual(list(iter_json_array(trozos)), items)
+
+    def test_iter_json_array_rejects_truncated_or_invalid_bodies(self):
+        texto = json.dumps([{"id": i, "name": "Press banca"} for i in range(20)])
+        cuerpos = {
+            "truncado": texto[:-1],
+            "cortado en un elemento": texto[:len(texto) // 2],
+            "elemento inválido": texto.replace('"Press banca"', "Press", 1),
+        }
+        for caso, cuerpo in cuerpos.items():
+            with self.subTest(caso=caso), self.assertRaises(ValueError):
+                list(iter_json_array(cuerpo[i:i + 16] for i in range(0, len(cuerpo), 16)))
+
+
+class NormalizeTextTests(SimpleTestCase):
+    def test_matches_the_nfd_version(self):
+        entradas = [
+            "Glúteo", " Cuerpo Completo ", "Pierna", "ÁÉÍÓÚ Ñandú Über", "Crème brûlée", "Ąčęż Łódź",
+            "Glu\u0301teo", "Espan\u0303a",  # ya descompuestas (NFD)
+            "Ελληνικά", "Ǆemal", "ǅ ǈ", "Ṩtraße", "Tiếng Việt", "日本語", "",
+        ]
+        for texto in entradas:
+            with self.subTest(texto=texto):
+                esperado = _quitar_acentos_nfd(texto).strip().lower().replace(" ", "_")
+                self.assertEqual(normalize_text.__wrapped__(texto), esperado)
+                self.assertEqual(normalize_text(texto), esperado)
+
+
+class ExerciseCatalogTests(SimpleTestCase):
+    def setUp(self):
+        self.ahora = 1000.0
+        reloj = mock.patch("routines.catalog.time.time", side_effect=lambda: self.ahora)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+
+        self.cargas = 0
+        self.catalogo_ms = [
+            {"id": f"{m}-{i}", "muscle_group": m, "difficulty": "principiante"}
+            for m in ("pecho", "espalda", "pierna") for i in range(3)
+        ]
+
+    def catalogo(self, **kwargs):
+        def loader(token, timeout):
+            self.cargas += 1
+            return iter(self.catalogo_ms)
+        return ExerciseCatalog(loader, lambda item: [(item["muscle_group"], "")], **kwargs)
+
+    def test_entries_expire_after_ttl_plus_stale_window(self):
+        catalogo = self.catalogo(ttl=10, stale_ttl=20)
+        self.assertTrue(catalogo.ensure_loaded("tok"))
+        self.assertTrue(catalogo.ensure_loaded("tok"))
+        self.assertEqual(self.cargas, 1)
+        self.assertEqual(len(catalogo.get("pecho", "")), 3)
+
+        self.ahora += 31
+        self.assertIsNone(catalogo.get("pecho", ""))
+        self.assertTrue(catalogo.ensure_loaded("tok"))
+        self.assertEqual(self.cargas, 2)
+
+    def test_failed_stream_does_not_count_as_loaded(self):
+        def cortado(token, timeout):
+            self.cargas += 1
+            yield self.catalogo_ms[0]
+            raise ValueError("Respuesta truncada")
+
+        catalogo = ExerciseCatalog(cortado, lambda item: [(item["muscle_group"], "")])
+        with self.assertRaises(ValueError):
+            catalogo.ensure_loaded("tok")
+        self.assertIsNone(catalogo.get("pecho", ""))
+        # La caída se recuerda: no se reintenta hasta que pase el backoff
+        self.assertFalse(catalogo.ensure_loaded("tok"))
+
+        self.ahora += 31
+        catalogo.loader = self.catalogo().loader
+        self.assertTrue(catalogo.ensure_loaded("tok"))
+        self.assertEqual(len(catalogo.get("pecho", "")), 3)
+        self.assertEqual(self.cargas, 2)
+
+    def test_failed_load_is_shared_and_remembered(self):
+        entro, seguir = threading.Event(), threading.Event()
+
+        def caido(token, timeout):
+            self.cargas += 1
+            entro.set()
+            seguir.wait(5)
+            return None  # p. ej. un 500 de /exercises/all/
+
+        catalogo = ExerciseCatalog(caido, lambda item: [(item["muscle_group"], "")], failure_backoff=30)
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(catalogo.ensure_loaded("tok"))) for _ in range(4)]
+        hilos[0].start()
+        entro.wait(5)
+        for hilo in hilos[1:]:
+            hilo.start()
+
+        # Quien no puede esperar más que su presupuesto no se queda en el lock
+        self.assertFalse(catalogo.ensure_loaded("tok", timeout=0.05))
+        time.sleep(0.05)
+        seguir.set()
+        for hilo in hilos:
+            hilo.join(5)
+
+        self.assertEqual(resultados, [False] * 4)
+        self.assertEqual(self.cargas, 1)
+        self.assertFalse(catalogo.ensure_loaded("tok"))
+        self.assertEqual(self.cargas, 1)
+
+        self.ahora += 31
+        catalogo.loader = self.catalogo().loader
+        self.assertTrue(catalogo.ensure_loaded("tok"))
+        self.assertEqual(self.cargas, 2)
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        catalogo = self.catalogo(ttl=10, stale_ttl=20)
+        catalogo.ensure_loaded("tok")
+        self.ahora += 15
+        with mock.patch.object(catalogo, "refresh_async") as refresco:
+            self.assertEqual(len(catalogo.get("pecho", "", "tok")), 3)
+        refresco.assert_called_once_with("tok")
+
+    def test_least_recently_used_entries_are_evicted(self):
+        catalogo = self.catalogo(max_entries=2)
+        catalogo.indexar(self.catalogo_ms[:6])  # pecho, espalda
+        catalogo.get("pecho", "")
+        catalogo.indexar(self.catalogo_ms[6:])  # pierna expulsa a espalda
+        self.assertIsNone(catalogo.get("espalda", ""))
+        self.assertIsNotNone(catalogo.get("pecho", ""))
+        self.assertIsNotNone(catalogo.get("pierna", ""))
+
+    def test_short_catalog_entry_falls_back_to_muscle_group_endpoint(self):
+        respuesta = mock.Mock(status_code=200, json=lambda: ejercicios_falsos("pecho", 8))
+        with mock.patch.object(exercise_catalog, "get", return_value=ejercicios_falsos("pecho", 2)), \
+                mock.patch("routines.utils.exercises_client") as cliente:
+            cliente.return_value.get.return_value = respuesta
+            self.assertEqual(len(fetch_exercises_by_muscle("pecho", "principiante", None)), 8)
+
+
+class SplitFetchTests(SimpleTestCase):
+    def setUp(self):
+        self.liberar = threading.Event()
+        self.addCleanup(self.liberar.set)
+        self.llamados = []
+
+    def fetch(self, lentos=(), cortos=()):
+        def fetch_exercises_by_muscle(musculo, difficulty, token, deadline, minimo):
+            self.llamados.append(musculo)
+            if musculo in cortos:
+                return ejercicios_falsos(musculo, 2)
+            if musculo in lentos:
+                self.liberar.wait(5)
+            return ejercicios_falsos(musculo)
+        return mock.patch("routines.utils.fetch_exercises_by_muscle", side_effect=fetch_exercises_by_muscle)
+
+    def test_deadline_raises_with_pending_muscles(self):
+        with self.fetch(lentos={"espalda"}):
+            with self.assertRaises(TiempoAgotadoEjercicios) as error:
+                fetch_exercises_for_split(DEFAULT_SPLIT, "principiante", None, deadline_seconds=0.2)
+        self.assertEqual(error.exception.pendientes, ["espalda"])
+
+    def test_short_muscle_aborts_and_cancels_pending_fetches(self):
+        # Un solo hilo: el primer músculo corre, el segundo queda bloqueado y el resto en cola
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        with self.fetch(lentos=set(DEFAULT_SPLIT.values()) - {"pierna"}, cortos={"pierna"}), \
+                mock.patch("routines.utils._fetch_executor", executor):
+            with self.assertRaises(EjerciciosInsuficientes) as error:
+                fetch_exercises_for_split(DEFAULT_SPLIT, "principiante", None)
+            self.liberar.set()
+            executor.shutdown(wait=True)
+        self.assertEqual((error.exception.musculo, error.exception.recibidos), ("pierna", 2))
+        # Según el momento "pecho" pudo arrancar; los que estaban en cola no llegan a correr
+        self.assertEqual(self.llamados[0], "pierna")
+        self.assertLessEqual(set(self.llamados), {"pierna", "pecho"})
+
+
+class ServiceClientRetryTests(SimpleTestCase):
+    def cliente(self, cls, servicios):
+        breaker = CircuitBreaker("usuarios", max_fallos=2, reset_timeout=30)
+        return cls("usuarios", servicios.url, retries=2, backoff=0.01, backoff_jitter=0, breaker=breaker)
+
+    def test_read_timeouts_are_not_retried_and_open_the_breaker(self):
+        with ServiciosFalsos(latencia=0.5) as servicios:
+            cliente = self.cliente(ServiceClient, servicios)
+            for _ in range(2):
+                inicio = time.monotonic()
+                with self.assertRaises(requests.RequestException):
+                    cliente.get("users/profile/", timeout=0.2)
+                self.assertLess(time.monotonic() - inicio, 0.45)
+            with self.assertRaises(CircuitoAbierto):
+                cliente.get("users/profile/")
+            self.assertEqual(servicios.peticiones["/users/profile/"], 2)
+
+    def test_async_read_timeouts_are_not_retried(self):
+        with ServiciosFalsos(latencia=0.5) as servicios:
+            cliente = self.cliente(AsyncServiceClient, servicios)
+
+            async def llamar():
+                with self.assertRaises(httpx.ReadTimeout):
+                    await cliente.get("users/profile/", timeout=0.2)
+
+            asyncio.run(llamar())
+            self.assertEqual(servicios.peticiones["/users/profile/"], 1)
+
+    def test_unavailable_responses_are_retried(self):
+        with ServiciosFalsos(tasa_fallos=1.0) as servicios:
+            self.assertEqual(self.cliente(ServiceClient, servicios).get("users/profile/").status_code, 503)
+            res = asyncio.run(self.cliente(AsyncServiceClient, servicios).get("users/profile/"))
+            self.assertEqual(res.status_code, 503)
+            self.assertEqual(servicios.peticiones["/users/profile/"], 6)
+
+    def test_cancelled_probe_does_not_leave_the_breaker_stuck(self):
+        with ServiciosFalsos(latencia=0.2) as servicios:
+            cliente = AsyncServiceClient("usuarios", servicios.url, breaker=CircuitBreaker("usuarios", max_fallos=1, reset_timeout=0.05))
+            cliente.breaker.fallo()
+            time.sleep(0.06)
+
+            async def llamar():
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(cliente.get("users/profile/"), 0.05)
+                return await cliente.get("users/profile/")
+
+            self.assertEqual(asyncio.run(llamar()).status_code, 200)
+            self.assertIsNone(cliente.breaker._abierto_desde)
+
+
+class AsyncSingleFlightTests(SimpleTestCase):
+    def test_follower_takes_over_when_the_leader_is_cancelled(self):
+        vuelo = AsyncSingleFlight()
+        llamadas = []
+
+        async def cargar():
+            llamadas.append(1)
+            await asyncio.sleep(0.05)
+            return len(llamadas)
+
+        async def escenario():
+            lider = asyncio.ensure_future(vuelo.do("k", cargar))
+            await asyncio.sleep(0)
+            seguidor = asyncio.ensure_future(vuelo.do("k", cargar))
+            await asyncio.sleep(0)
+            lider.cancel()
+            return await asyncio.wait_for(seguidor, 1)
+
+        self.assertEqual(asyncio.run(escenario()), 2)
+        self.assertEqual(len(llamadas), 2)
+
+
+class SelectionTests(SimpleTestCase):
+    def setUp(self):
+        equipos = ["Mancuernas", "Barra", "Polea", "Máquina", "Peso corporal"]
+        self.catalogo = {
+            m: [dict(ex, equipment_display=equipos[i % len(equipos)]) for i, ex in enumerate(ejercicios_falsos(m, 40))]
+            for m in DEFAULT_SPLIT.values()
+        }
+
+    def test_seeded_selection_is_reproducible(self):
+        semana = SelectorEjercicios(self.catalogo, seed=42).semana(DEFAULT_SPLIT, 5)
+        self.assertEqual(semana, SelectorEjercicios(self.catalogo, seed=42).semana(DEFAULT_SPLIT, 5))
+
+    def test_no_repeats_across_week_and_diverse_equipment(self):
+        # Todos los días del mismo músculo: sigue sin repetir mientras alcance
+        split = {dia: "pecho" for dia in DEFAULT_SPLIT}
+        semana = SelectorEjercicios(self.catalogo, seed=1).semana(split, 5)
+        ids = [ex["id"] for dia in semana.values() for ex in dia]
+        self.assertEqual(len(ids), len(set(ids)))
+        for ejercicios in semana.values():
+            self.assertEqual(len({ex["equipment_display"] for ex in ejercicios}), 5)
+
+    def test_small_catalog_repeats_across_days_but_not_within(self):
+        split = {"lunes": "pecho", "martes": "pecho"}
+        semana = SelectorEjercicios({"pecho": ejercicios_falsos("pecho", 6)}, seed=3).semana(split, 5)
+        for ejercicios in semana.values():
+            self.assertEqual(len({ex["id"] for ex in ejercicios}), 5)
+
+
+class RoutineReadQueriesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=MicroserviceUser(1))
+
+    def test_list_query_count_is_constant(self):
+        for _ in range(10):
+            crear_rutina()
+        crear_rutina(user_id=2)
+
+        with self.assertNumQueries(3):
+            res = self.client.get("/routines/all/")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.data), 10)
+        self.assertEqual([d["dia"] for d in res.data[0]["dias"]], list(DEFAULT_SPLIT))
+        self.assertEqual(len(res.data[0]["dias"][0]["detalles"]), 5)
+
+    def test_detail_is_served_from_snapshot(self):
+        rutina = crear_rutina()
+        with self.assertNumQueries(1):
+            res = self.client.get(f"/routines/{rutina.id}/")
+        self.assertEqual(res.status_code, 200)
+
+        completa = Rutina.objects.con_detalles().get(id=rutina.id)
+        self.assertEqual(res.json(), json.loads(JSONRenderer().render(RutinaSerializer(completa).data)))
+
+    def test_by_days_is_served_from_snapshot(self):
+        rutina = crear_rutina()
+        with self.assertNumQueries(1):
+            res = self.client.get(f"/routines/{rutina.id}/days/")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(list(res.json()["dias"]), list(DEFAULT_SPLIT))
+        self.assertEqual(len(res.json()["dias"]["lunes"]["detalles"]), 5)
+
+    def test_snapshot_etag_returns_304(self):
+        rutina = crear_rutina()
+        res = self.client.get(f"/routines/{rutina.id}/days/")
+        res = self.client.get(f"/routines/{rutina.id}/days/", HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b"")
+
+    def test_missing_snapshot_is_built_on_first_read(self):
+        rutina = crear_rutina()
+        esperado = self.client.get(f"/routines/{rutina.id}/").json()
+        esperado_dias = self.client.get(f"/routines/{rutina.id}/days/").content
+        RutinaSnapshot.objects.all().delete()
+
+        # snapshot + proyección (un solo JOIN) + INSERT del snapshot
+        with self.assertNumQueries(3):
+            res = self.client.get(f"/routines/{rutina.id}/")
+        self.assertEqual(res.json(), esperado)
+        self.assertTrue(RutinaSnapshot.objects.filter(rutina_id=rutina.id).exists())
+        self.assertEqual(self.client.get(f"/routines/{rutina.id}/days/").content, esperado_dias)
+
+    def test_other_users_routine_is_not_found(self):
+        rutina = crear_rutina(user_id=2)
+        self.assertEqual(self.client.get(f"/routines/{rutina.id}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/routines/{rutina.id}/days/").status_code, 404)
+
+    def test_summary_skips_days_and_exercises(self):
+        for _ in range(5):
+            crear_rutina()
+        with self.assertNumQueries(1):
+            res = self.client.get("/routines/all/", {"fields": "summary"})
+        self.assertEqual(len(res.data), 5)
+        self.assertEqual(set(res.data[0]), {"id", "created_at", "duracion_minutos"})
+
+    def test_cursor_pagination_walks_all_routines(self):
+        ids = {str(crear_rutina().id) for _ in range(5)}
+        vistos = []
+        res = self.client.get("/routines/all/", {"fields": "summary", "page_size": 2})
+        while True:
+            vistos += [r["id"] for r in res.data["results"]]
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+        self.assertEqual(len(vistos), 5)
+        self.assertEqual(set(vistos), ids)
+
+
+class ExerciseDimensionTests(TestCase):
+    def test_exercises_are_shared_and_never_rewritten(self):
+        primera = crear_rutina()
+        crear_rutina(user_id=2)
+        usados = set(DiaEjercicio.objects.values_list("ejercicio_id", flat=True))
+        self.assertEqual(set(Ejercicio.objects.values_list("id", flat=True)), usados)
+        self.assertLess(len(usados), DiaEjercicio.objects.count())
+
+        client = APIClient()
+        client.force_authenticate(user=MicroserviceUser(1))
+        antes = client.get("/routines/all/").json()
+        nombres = dict(Ejercicio.objects.values_list("id", "name"))
+
+        ejercicios = {m: ejercicios_falsos(m) for m in DEFAULT_SPLIT.values()}
+        for ex in ejercicios["pecho"]:
+            ex["name"] = "Press renombrado"
+        rutina = guardar_rutina(construir_rutina(1, 40, "ganar_musculo", "principiante", ejercicios))
+
+        # La rutina anterior se ve igual y la nueva coincide entre snapshot y DB
+        despues = client.get("/routines/all/").json()
+        self.assertIn(antes[0], despues)
+        self.assertEqual(client.get(f"/routines/{primera.id}/").json(), antes[0])
+        self.assertEqual(dict(Ejercicio.objects.filter(id__in=nombres).values_list("id", "name")), nombres)
+        desde_db = RutinaSerializer(Rutina.objects.con_detalles().get(id=rutina.id)).data
+        self.assertEqual(client.get(f"/routines/{rutina.id}/").json(), json.loads(JSONRenderer().render(desde_db)))
+
+
+class ArchiveRoutinesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        hace_un_ano = timezone.now() - timedelta(days=365)
+        self.rutinas = {1: [], 2: []}
+        for user_id, n in ((1, 3), (2, 2)):
+            for i in range(n):
+                rutina = crear_rutina(user_id)
+                Rutina.objects.filter(id=rutina.id).update(created_at=hace_un_ano + timedelta(days=i))
+                self.rutinas[user_id].append(rutina.id)
+
+    def test_archives_in_chunks_keeping_latest_per_user(self):
+        client = APIClient()
+        client.force_authenticate(user=MicroserviceUser(1))
+        vieja = self.rutinas[1][0]
+        esperado = client.get(f"/routines/{vieja}/days/").content
+
+        lotes = list(archivar_rutinas(timezone.now(), chunk_size=2))
+        self.assertEqual(lotes, [2, 1])
+
+        quedan = set(Rutina.objects.values_list("id", flat=True))
+        self.assertEqual(quedan, {self.rutinas[1][-1], self.rutinas[2][-1]})
+        self.assertEqual(DiaRutina.objects.count(), 2 * len(DEFAULT_SPLIT))
+        self.assertEqual(RutinaArchivada.objects.count(), 3)
+
+        self.assertEqual(client.get("/routines/active/").data["rutina_id"], str(self.rutinas[1][-1]))
+        self.assertEqual(client.get(f"/routines/{vieja}/days/").content, esperado)
+
+    def test_chunks_resume_after_rows_with_the_same_created_at(self):
+        Rutina.objects.update(created_at=timezone.now() - timedelta(days=30))
+        lotes = list(archivar_rutinas(timezone.now(), chunk_size=1))
+        self.assertEqual(lotes, [1, 1, 1])
+        self.assertEqual(Rutina.objects.count(), 2)
+        self.assertEqual(set(Rutina.objects.values_list("user_id", flat=True)), {1, 2})
+
+    def test_purge_skips_the_archive_table(self):
+        self.assertEqual(sum(archivar_rutinas(timezone.now(), archivar=False)), 3)
+        self.assertFalse(RutinaArchivada.objects.exists())
+
+
+class ActiveRoutineCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=MicroserviceUser(1))
+
+    def test_generation_writes_through(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rutina = crear_rutina()
+        with self.assertNumQueries(0):
+            res = self.client.get("/routines/active/")
+        self.assertEqual(res.data["rutina_id"], str(rutina.id))
+
+    def test_missing_routine_is_cached(self):
+        with self.assertNumQueries(1):
+            self.client.get("/routines/active/")
+        with self.assertNumQueries(0):
+            res = self.client.get("/routines/active/")
+        self.assertIsNone(res.data["rutina_id"])
+
+    def test_delete_invalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            anterior = crear_rutina()
+        with self.captureOnCommitCallbacks(execute=True):
+            ultima = crear_rutina()
+        Rutina.objects.filter(id=ultima.id).delete()
+        res = self.client.get("/routines/active/")
+        self.assertEqual(res.data["rutina_id"], str(anterior.id))
+
+    def test_slow_miss_does_not_overwrite_a_newer_write_through(self):
+        def cargar():
+            fijar_rutina_activa(1, "nueva")  # otra petición generó mientras se leía la DB
+            return "vieja"
+
+        self.assertEqual(obtener_rutina_activa(1, cargar), "vieja")
+        self.assertEqual(obtener_rutina_activa(1, lambda: None), "nueva")
+
+    def test_local_cache_ttl_is_capped(self):
+        with mock.patch("routines.cache.cache.set") as guardar:
+            fijar_rutina_activa(1, "x")
+        self.assertEqual(guardar.call_args.args[2], 5)
+
+
+class GenerateRoutineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=MicroserviceUser(1))
+
+        perfil = {"experience": "principiante", "goal": "ganar_musculo"}
+        ejercicios = {m: ejercicios_falsos(m) for m in DEFAULT_SPLIT.values()}
+        self.fetch_profile = self.patch("routines.services.fetch_profile", return_value=perfil)
+        self.fetch_exercises = self.patch("routines.services.fetch_exercises_for_split", return_value=ejercicios)
+
+    def patch(self, target, **kwargs):
+        patcher = mock.patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_generate_persists_routine(self):
+        res = self.client.post("/routines/generate/")
+        self.assertEqual(res.status_code, 200)
+        rutina = Rutina.objects.get(id=res.data["rutina_id"])
+        self.assertEqual(rutina.dias.count(), len(DEFAULT_SPLIT))
+
+    def test_profile_is_cached_between_generations(self):
+        self.client.post("/routines/generate/")
+        self.client.post("/routines/generate/")
+        self.assertEqual(self.fetch_profile.call_count, 1)
+
+        self.client.delete("/routines/profile-cache/")
+        self.client.post("/routines/generate/")
+        self.assertEqual(self.fetch_profile.call_count, 2)
+
+    def test_generate_reports_stage_timings(self):
+        res = self.client.post("/routines/generate/")
+        timing = res["Server-Timing"]
+        for etapa in ("perfil", "seleccion", "db_rutinas", "db_ejercicios", "db;"):
+            self.assertIn(etapa, timing)
+
+        res = self.client.get("/metrics", REMOTE_ADDR="127.0.0.1")
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('routines_generation_stage_seconds_count{stage="perfil"', res.content.decode())
+        self.assertIn('routines_request_db_queries_count{view="generar_rutina"}', res.content.decode())
+
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.5").status_code, 403)
+
+    def test_generation_clones_a_template_when_the_pool_is_filled(self):
+        nuevas, errores = rellenar_plantillas(None, por_perfil=2)
+        self.assertEqual((len(nuevas), errores), (24, []))
+        self.assertEqual(self.fetch_exercises.call_count, 3)  # una vez por experiencia
+
+        res = self.client.post("/routines/generate/")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.fetch_exercises.call_count, 3)
+
+        rutina = Rutina.objects.con_detalles().get(id=res.data["rutina_id"])
+        dias = [
+            {"dia": d.dia, "musculo": d.musculo, "nombre": d.nombre, "detalles": [x.ejercicio_id for x in d.detalles.all()]}
+            for d in rutina.dias.all()
+        ]
+        plantillas = [
+            [dict(d, detalles=[x["ejercicio_id"] for x in d["detalles"]]) for d in p.contenido["dias"]]
+            for p in PlantillaRutina.objects.filter(goal="ganar_musculo", experience="principiante")
+        ]
+        self.assertIn(dias, plantillas)
+
+    def test_refill_tops_up_and_replaces_expired_templates(self):
+        rellenar_plantillas(None, por_perfil=2)
+        self.assertEqual(rellenar_plantillas(None, por_perfil=2)[0], [])
+
+        viejas = set(PlantillaRutina.objects.values_list("id", flat=True))
+        PlantillaRutina.objects.update(created_at=timezone.now() - timedelta(days=2))
+        nuevas, _ = rellenar_plantillas(None, por_perfil=2, max_age=86400)
+        self.assertEqual(len(nuevas), 24)
+        self.assertFalse(PlantillaRutina.objects.filter(id__in=viejas).exists())
+
+    def test_job_mode_enqueues_and_reports_status(self):
+        res = self.client.post("/routines/generate/?mode=job")
+        self.assertEqual(res.status_code, 202)
+        job_url = res["Location"]
+
+        res = self.client.get(job_url)
+        self.assertEqual(res.data["estado"], "pendiente")
+
+        # El job guarda el perfil, no el JWT del usuario
+        job = reclamar_job()
+        self.assertEqual((job.experience, job.goal), ("principiante", "ganar_musculo"))
+        self.assertFalse(hasattr(job, "token"))
+        cache.clear()
+        with override_settings(EXERCISES_SERVICE_TOKEN="servicio"):
+            ejecutar_job(job)
+        self.assertIsNone(reclamar_job())
+        self.assertEqual(self.fetch_profile.call_count, 1)
+        self.assertEqual(self.fetch_exercises.call_args.args[2], "servicio")
+
+        res = self.client.get(job_url)
+        self.assertEqual(res.data["estado"], "completado")
+        self.assertTrue(Rutina.objects.filter(id=res.data["rutina_id"]).exists())
+
+    def test_job_mode_reports_profile_errors_when_enqueuing(self):
+        self.fetch_profile.side_effect = PerfilNoDisponible("MS Usuarios caído")
+        res = self.client.post("/routines/generate/?mode=job")
+        self.assertEqual(res.status_code, 502)
+        self.assertIsNone(reclamar_job())
+
+    def test_idempotency_key_replays_the_stored_response(self):
+        res = self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        repetida = self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(repetida.status_code, 200)
+        self.assertEqual(repetida.data["rutina_id"], res.data["rutina_id"])
+        self.assertEqual(repetida["Idempotent-Replayed"], "true")
+        self.assertEqual(Rutina.objects.count(), 1)
+
+        otra = self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="tap-2")
+        self.assertNotEqual(otra.data["rutina_id"], res.data["rutina_id"])
+        self.assertEqual(self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="x" * 256).status_code, 400)
+
+    def test_idempotency_key_is_released_on_upstream_errors(self):
+        self.fetch_profile.side_effect = PerfilNoDisponible("MS Usuarios caído")
+        res = self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(res.status_code, 502)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+        self.fetch_profile.side_effect = None
+        res = self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="tap-1")
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", res)
+
+    def test_expired_idempotency_keys_are_purged(self):
+        self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="vieja")
+        ClaveIdempotencia.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.client.post("/routines/generate/", HTTP_IDEMPOTENCY_KEY="nueva")
+
+        call_command("purge_idempotency_keys", "--chunk-size", "1", stdout=StringIO())
+        self.assertEqual(list(ClaveIdempotencia.objects.values_list("clave", flat=True)), ["nueva"])
+
+    def test_coalesced_requests_with_the_same_key_are_replays(self):
+        entro, seguir = threading.Event(), threading.Event()
+        llamadas = []
+
+        def ejecutar():
+            llamadas.append(1)
+            entro.set()
+            seguir.wait(5)
+            return 200, {"rutina_id": "r1"}
+
+        self.patch("routines.idempotency.reclamar", return_value=None)
+        self.patch("routines.idempotency.guardar")
+        resultados = {}
+        hilos = {
+            nombre: threading.Thread(target=lambda n=nombre: resultados.__setitem__(n, con_idempotencia(1, "k", ejecutar)))
+            for nombre in ("lider", "seguidor")
+        }
+        hilos["lider"].start()
+        entro.wait(5)
+        hilos["seguidor"].start()
+        time.sleep(0.1)  # que el seguidor llegue a esperar al líder
+        seguir.set()
+        for hilo in hilos.values():
+            hilo.join(5)
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados["lider"], (200, {"rutina_id": "r1"}, False))
+        self.assertEqual(resultados["seguidor"], (200, {"rutina_id": "r1"}, True))
+
+    def test_concurrent_generations_for_a_user_share_one_execution(self):
+        entro, seguir = threading.Event(), threading.Event()
+
+        def generar(user_id, token):
+            entro.set()
+            seguir.wait(5)
+            return object()
+
+        generar_mock = self.patch("routines.services.generar_rutina", side_effect=generar)
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(generar_rutina_compartida(1, None))) for _ in range(3)]
+        hilos[0].start()
+        entro.wait(5)
+        for hilo in hilos[1:]:
+            hilo.start()
+        time.sleep(0.1)  # que los demás lleguen a esperar al primero
+        seguir.set()
+        for hilo in hilos:
+            hilo.join(5)
+
+        self.assertEqual(generar_mock.call_count, 1)
+        self.assertEqual(len(resultados), 3)
+        self.assertEqual(len({id(r) for r in resultados}), 1)
+
+
+class DatabasePoolMetricsTests(SimpleTestCase):
+    def test_pool_stats_are_exposed(self):
+        stats = {"pool_size": 4, "pool_available": 3, "requests_num": 120, "requests_wait_ms": 1500}
+        with mock.patch("routines.metrics.estadisticas_pools", return_value=[("default", stats)]):
+            res = APIClient().get("/metrics", REMOTE_ADDR="127.0.0.1")
+        contenido = res.content.decode()
+        self.assertIn('routines_db_pool_size{alias="default"} 4.0', contenido)
+        self.assertIn('routines_db_pool_requests_total{alias="default"} 120.0', contenido)
+        self.assertIn('routines_db_pool_wait_seconds_total{alias="default"} 1.5', contenido)
+        self.assertIn('routines_db_pool_timeouts_total{alias="default"} 0.0', contenido)
+        self.assertIn("# TYPE routines_db_connections_total counter", contenido)
+
+
+class FakeServicesGenerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.servicios = ServiciosFalsos(catalogo=100).start()
+        self.addCleanup(self.servicios.stop)
+        settings = override_settings(
+            USERS_SERVICE_URL=self.servicios.url,
+            EXERCISES_SERVICE_URL=self.servicios.url,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for limpiar in (reiniciar_clientes, exercise_catalog.clear):
+            limpiar()
+            self.addCleanup(limpiar)
+
+    def test_generate_over_http(self):
+        client = APIClient()
+        for user_id in (1, 2):
+            client.force_authenticate(user=MicroserviceUser(user_id))
+            res = client.post("/routines/generate/")
+            self.assertEqual(res.status_code, 200)
+
+        # El catálogo se descarga una vez y sirve a las dos generaciones
+        self.assertEqual(self.servicios.peticiones["/exercises/all/"], 1)
+        self.assertEqual(self.servicios.peticiones["/users/profile/"], 2)
+        self.assertNotIn("/exercises/muscle-group/", self.servicios.peticiones)
+
+    def test_async_split_downloads_catalog_once_and_remembers_failures(self):
+        async def generar(n):
+            return await asyncio.gather(
+                *(afetch_exercises_for_split(DEFAULT_SPLIT, "intermedio", "tok") for _ in range(n)),
+                return_exceptions=True,
+            )
+
+        resultados = asyncio.run(generar(3))
+        self.assertTrue(all(isinstance(r, dict) for r in resultados))
+        self.assertEqual(self.servicios.peticiones["/exercises/all/"], 1)
+
+        # Con el MS caído la descarga fallida se comparte y no se repite durante el backoff
+        exercise_catalog.clear()
+        self.servicios.tasa_fallos = 1.0
+        asyncio.run(generar(3))
+        descargas = self.servicios.peticiones["/exercises/all/"]
+        self.assertEqual(descargas, 1 + 3)  # un intento y dos reintentos por 503
+        asyncio.run(generar(1))
+        self.assertEqual(self.servicios.peticiones["/exercises/all/"], descargas)
+
+
+class JWTFastPathTests(TestCase):
+    def setUp(self):
+        tokens_verificados.clear()
+        self.addCleanup(tokens_verificados.clear)
+
+    def test_verified_token_is_reused_until_exp(self):
+        token = AccessToken()
+        token["user_id"] = 3
+        crear_rutina(user_id=3)
+
+        with mock.patch.object(
+            MicroserviceJWTAuthentication, "get_validated_token",
+            autospec=True, side_effect=MicroserviceJWTAuthentication.get_validated_token,
+        ) as validar:
+            for _ in range(3):
+                res = self.client.get("/routines/active/", HTTP_AUTHORIZATION=f"Bearer {token}")
+                self.assertEqual(res.status_code, 200)
+            self.assertEqual(validar.call_count, 1)
+
+            # Pasado el exp la entrada ya no sirve y el token se vuelve a validar
+            with mock.patch("routines.authentication.time.time", return_value=token["exp"] + 1):
+                res = self.client.get("/routines/active/", HTTP_AUTHORIZATION=f"Bearer {token}")
+            self.assertEqual(validar.call_count, 2)
+
+    def test_invalid_token_is_not_cached(self):
+        for _ in range(2):
+            res = self.client.get("/routines/active/", HTTP_AUTHORIZATION="Bearer no-es-un-jwt")
+            self.assertEqual(res.status_code, 401)
+        self.assertEqual(len(tokens_verificados._entries), 0)
+
+
+class AsyncGenerateRoutineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        perfil = {"experience": "intermedio", "goal": "tonificar"}
+        ejercicios = {m: ejercicios_falsos(m) for m in DEFAULT_SPLIT.values()}
+        for target, valor in (
+            ("routines.services.afetch_profile", perfil),
+            ("routines.services.afetch_exercises_for_split", ejercicios),
+        ):
+            patcher = mock.patch(target, new=mock.AsyncMock(return_value=valor))
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+    def test_generate_async(self):
+        token = AccessToken()
+        token["user_id"] = 7
+        res = self.client.post("/routines/generate/async/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(res.status_code, 200)
+        rutina = Rutina.objects.get(id=res.json()["rutina_id"])
+        self.assertEqual(rutina.user_id, 7)
+
+    def test_requires_token(self):
+        res = self.client.post("/routines/generate/async/")
+        self.assertEqual(res.status_code, 401)
+
+
+@override_settings(ROUTINES_BATCH_OPERATOR_IDS=[99])
+class BatchGenerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=MicroserviceUser(99))
+        patcher = mock.patch(
+            "routines.services.fetch_exercises_for_split",
+            return_value={m: ejercicios_falsos(m) for m in DEFAULT_SPLIT.values()},
+        )
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batch_fetches_once_per_experience(self):
+        perfiles = [
+            {"user_id": i, "experience": ["principiante", "avanzado"][i % 2], "goal": "tonificar"}
+            for i in range(1, 21)
+        ]
+        with CaptureQueriesContext(connection) as consultas:
+            res = self.client.post("/routines/generate/batch/", {"profiles": perfiles}, format="json")
+        self.assertEqual(res.status_code, 200)
+        inserts_rutina = [q for q in consultas if q["sql"].startswith('INSERT INTO "routines_rutina" ')]
+        self.assertEqual(len(inserts_rutina), 1)
+        self.assertEqual(len(res.data["creadas"]), 20)
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(Rutina.objects.count(), 20)
+
+    def test_batch_requires_operator(self):
+        self.client.force_authenticate(user=MicroserviceUser(1))
+        res = self.client.post("/routines/generate/batch/", {"profiles": []}, format="json")
+        self.assertEqual(res.status_code, 403)
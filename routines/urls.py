@@ -1,10 +1,17 @@
 from django.urls import path
-from .views import GenerateRoutineView, ListRutinasView, GetRutinaView, CheckRoutineView, GetRoutineByDays
+from .views import (
+    GenerateRoutineView, ListRutinasView, GetRutinaView, CheckRoutineView, GetRoutineByDays,
+    InvalidateProfileCacheView, GetJobView, GenerateRoutineBatchView, generar_rutina_async,
+)
 
 urlpatterns = [
     path("generate/", GenerateRoutineView.as_view(), name="generar_rutina"),
+    path("generate/async/", generar_rutina_async, name="generar_rutina_async"),
+    path("generate/batch/", GenerateRoutineBatchView.as_view(), name="generar_rutinas_lote"),
     path("all/", ListRutinasView.as_view(), name="listar_rutinas"),
     path("<uuid:rutina_id>/", GetRutinaView.as_view(), name="obtener_rutina"),
     path("active/", CheckRoutineView.as_view(), name="rutina_activa"),
     path("<uuid:rutina_id>/days/", GetRoutineByDays.as_view(), name="rutina_dia"),
+    path("jobs/<uuid:job_id>/", GetJobView.as_view(), name="estado_job"),
+    path("profile-cache/", InvalidateProfileCacheView.as_view(), name="invalidar_perfil"),
 ]
\ No newline at end of file
@@ -1,7 +1,66 @@
+import asyncio
+import codecs
+import contextvars
+import json
 import random
-import requests
+import time
 import unicodedata
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from .catalog import ExerciseCatalog
+from .clients import (
+    exercises_client,
+    users_client,
+    exercises_async_client,
+    users_async_client,
+    CircuitoAbierto,
+)
+from .concurrency import AsyncSingleFlight
+from .metrics import etapa
+
+# Timeout máximo (segundos) de una sola llamada al MS de Ejercicios
+EXERCISES_REQUEST_TIMEOUT = getattr(settings, "EXERCISES_SERVICE_READ_TIMEOUT", 50)
+
+# Pool compartido para las llamadas concurrentes al MS de Ejercicios.
+# Es global al proceso para acotar el número total de hilos entre peticiones.
+_fetch_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "EXERCISES_FETCH_WORKERS", 10),
+    thread_name_prefix="exercises-fetch",
+)
+
+
+class EjerciciosInsuficientes(Exception):
+    """
+    Un músculo del split no alcanzó el mínimo de ejercicios requerido.
+    """
+    def __init__(self, musculo, recibidos):
+        self.musculo = musculo
+        self.recibidos = recibidos
+        super().__init__(
+            f"No hay suficientes ejercicios para {musculo}. Se recibieron {recibidos}"
+        )
+
+
+class PerfilNoDisponible(Exception):
+    """
+    El MS de Usuarios no devolvió un perfil válido.
+    """
+    def __init__(self, status_code):
+        self.status_code = status_code
+        super().__init__(f"No se pudo obtener el perfil (status {status_code})")
+
+
+class TiempoAgotadoEjercicios(Exception):
+    """
+    Se agotó el presupuesto de tiempo antes de recibir todos los músculos.
+    """
+    def __init__(self, pendientes):
+        self.pendientes = pendientes
+        super().__init__(
+            f"Tiempo agotado obteniendo ejercicios para: {', '.join(pendientes)}"
+        )
 
 # Duración total (minutos) por experiencia
 def calcular_duracion_total(experience):
@@ -35,75 +94,334 @@ def calcular_series_reps_rest(goal, experience):
     # default fallback
     return 4, 10, 60
 
+# Obtener perfil (from Users MS)
+def fetch_profile(token):
+    res = users_client().get("users/profile/", token)
+    if res.status_code != 200:
+        raise PerfilNoDisponible(res.status_code)
+    return res.json()["user"]
+
+async def afetch_profile(token):
+    res = await users_async_client().get("users/profile/", token)
+    if res.status_code != 200:
+        raise PerfilNoDisponible(res.status_code)
+    return res.json()["user"]
+
 # Obtener ejercicios por músculo (from Exercises MS)
+def _quitar_acentos_nfd(t):
+    """
+    Quita acentos descomponiendo en NFD y descartando las marcas (Mn).
+    """
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', t)
+        if unicodedata.category(c) != 'Mn'
+    )
+
+# Tabla para str.translate: letras latinas acentuadas (U+00C0-U+017F) -> su
+# forma sin acento, y marcas combinantes sueltas (U+0300-U+036F) -> nada.
+_TABLA_ACENTOS = {
+    **{cp: _quitar_acentos_nfd(chr(cp)) for cp in range(0x00C0, 0x0180) if _quitar_acentos_nfd(chr(cp)) != chr(cp)},
+    **{cp: None for cp in range(0x0300, 0x0370)},
+}
+
+@lru_cache(maxsize=1024)
 def normalize_text(t):
     """
     Normaliza removiendo acentos, espacios extra y convirtiendo a snake_case simple.
+    Memoizada: en la práctica solo recibe unas pocas docenas de etiquetas.
     """
     if not t:
         return ""
 
-    # Quitar acentos
-    t = ''.join(
-        c for c in unicodedata.normalize('NFD', t)
-        if unicodedata.category(c) != 'Mn'
-    )
+    # Quitar acentos (la tabla cubre el español; el resto pasa por NFD)
+    t = t.translate(_TABLA_ACENTOS)
+    if not t.isascii():
+        t = _quitar_acentos_nfd(t)
 
     return t.strip().lower().replace(" ", "_")
 
-def fetch_exercises_by_muscle(muscle_group, difficulty, token):
-    base = settings.EXERCISES_SERVICE_URL
+def _timeout_restante(deadline):
+    """
+    Timeout para la siguiente llamada: nunca excede el presupuesto restante.
+    """
+    if deadline is None:
+        return EXERCISES_REQUEST_TIMEOUT
+    return max(min(EXERCISES_REQUEST_TIMEOUT, deadline - time.monotonic()), 0.1)
+
+# Un error de JSON más atrás que esto del final del buffer no es un elemento
+# a medio llegar (literal, número o escape cortado) sino JSON inválido
+MARGEN_ELEMENTO_INCOMPLETO = 32
+
+
+def iter_json_array(chunks):
+    """
+    Recorre los elementos de un arreglo JSON a medida que llegan los trozos
+    de texto, sin tener el documento completo en memoria. Lanza ValueError si
+    el JSON es inválido o el stream termina antes de cerrar el arreglo.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    iniciado = False
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not iniciado:
+                if buffer[pos] != "[":
+                    raise ValueError("Se esperaba un arreglo JSON")
+                iniciado = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, fin = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if len(buffer) - e.pos > MARGEN_ELEMENTO_INCOMPLETO and not e.msg.startswith("Unterminated string"):
+                    raise ValueError(f"JSON inválido: {e.msg}") from e
+                break  # elemento incompleto: esperar el siguiente trozo
+            if fin == len(buffer) and not isinstance(item, (dict, list)):
+                break  # un escalar al final del buffer puede seguir (p. ej. un número)
+            yield item
+            pos = fin
+        buffer = buffer[pos:]
+    if not iniciado:
+        raise ValueError("Respuesta vacía")
+    raise ValueError("Respuesta truncada: el arreglo no se cerró")
+
+def _descargar_catalogo(token, timeout=None):
+    """
+    Descarga el catálogo completo (/exercises/all/) en streaming y devuelve
+    un iterador de ejercicios, o None si falla.
+    """
+    res = exercises_client().get("exercises/all/", token, timeout=timeout, stream=True)
+    if res.status_code != 200:
+        res.close()
+        return None
+
+    def items():
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            chunks = (decoder.decode(c) for c in res.iter_content(chunk_size=64 * 1024))
+            yield from iter_json_array(chunks)
+        finally:
+            res.close()
+
+    return items()
+
+def _claves_catalogo(item):
+    """
+    Claves (músculo, dificultad) normalizadas bajo las que se indexa un ejercicio.
+    La clave con dificultad vacía agrupa todas las dificultades del músculo.
+    """
+    mg = normalize_text(item.get("muscle_group") or item.get("muscle_group_display"))
+    diff = normalize_text(item.get("difficulty") or item.get("difficulty_display"))
+    return [(mg, ""), (mg, diff)]
 
-    # 1) try muscle-group endpoint
+exercise_catalog = ExerciseCatalog(
+    loader=_descargar_catalogo,
+    keys=_claves_catalogo,
+    ttl=getattr(settings, "EXERCISE_CATALOG_TTL", 300),
+    stale_ttl=getattr(settings, "EXERCISE_CATALOG_STALE_TTL", 600),
+    max_entries=getattr(settings, "EXERCISE_CATALOG_MAX_ENTRIES", 256),
+    shared_cache=getattr(settings, "EXERCISE_CATALOG_SHARED_CACHE", None),
+    failure_backoff=getattr(settings, "EXERCISE_CATALOG_FAILURE_BACKOFF", 30),
+)
+
+def fetch_exercises_by_muscle(muscle_group, difficulty, token, deadline=None, minimo=5):
+    with etapa("ejercicios", muscle=muscle_group) as e:
+        ejercicios, e["source"] = _fetch_exercises_by_muscle(muscle_group, difficulty, token, deadline, minimo)
+        return ejercicios
+
+def _fetch_exercises_by_muscle(muscle_group, difficulty, token, deadline, minimo):
+    """
+    Devuelve (ejercicios, origen); el origen queda en las métricas de la etapa.
+    Si el catálogo no tiene `minimo` ejercicios del nivel se usa el endpoint
+    por músculo (todas las dificultades), igual que cuando no tiene ninguno.
+    """
+    target_muscle = normalize_text(muscle_group)
+    target_diff = normalize_text(difficulty)
+
+    # 0) catálogo local en memoria (se descarga completo una sola vez)
     try:
-        res = requests.get(
-            f"{base}exercises/muscle-group/",
+        cached = exercise_catalog.get(target_muscle, target_diff, token)
+        if cached is None and exercise_catalog.ensure_loaded(token, timeout=_timeout_restante(deadline)):
+            cached = exercise_catalog.get(target_muscle, target_diff, token)
+        if cached and len(cached) >= minimo:
+            return cached, "catalogo"
+    except Exception:
+        pass
+
+    # 1) fallback: muscle-group endpoint
+    try:
+        res = exercises_client().get(
+            "exercises/muscle-group/",
+            token,
             params={"muscle_group": muscle_group},
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=50
+            timeout=_timeout_restante(deadline)
         )
 
         if res.status_code == 200:
-            return res.json()
+            return res.json(), "fallback"
+    except CircuitoAbierto:
+        raise
     except:
         pass
 
-    # 2) fallback: /all/
+    return [], "sin_datos"
+
+
+def fetch_exercises_for_split(split, difficulty, token, minimo=5, deadline_seconds=None):
+    """
+    Obtiene en paralelo los ejercicios de cada músculo del split.
+
+    Todas las peticiones comparten un presupuesto de tiempo; en cuanto un
+    músculo no alcanza `minimo` ejercicios se cancelan las que siguen
+    pendientes. Devuelve un dict {musculo: [ejercicios]}.
+    """
+    if deadline_seconds is None:
+        deadline_seconds = getattr(settings, "EXERCISES_FETCH_DEADLINE", 60)
+    deadline = time.monotonic() + deadline_seconds
+
+    musculos = list(dict.fromkeys(split.values()))
+    # Cada hilo corre en una copia del contexto para que sus tiempos
+    # lleguen a la cabecera Server-Timing de la petición
+    futures = {
+        _fetch_executor.submit(
+            contextvars.copy_context().run, fetch_exercises_by_muscle, m, difficulty, token, deadline, minimo
+        ): m
+        for m in musculos
+    }
+
+    resultados = {}
+    pendientes = set(futures)
     try:
-        res = requests.get(
-            f"{base}exercises/all/",
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=50
-        )
-        if res.status_code != 200:
-            return []
+        while pendientes:
+            restante = deadline - time.monotonic()
+            if restante <= 0:
+                raise TiempoAgotadoEjercicios(sorted(futures[f] for f in pendientes))
 
-        items = res.json()
+            listos, pendientes = wait(pendientes, timeout=restante, return_when=FIRST_COMPLETED)
+            for f in listos:
+                musculo = futures[f]
+                ejercicios = f.result()
+                if len(ejercicios) < minimo:
+                    raise EjerciciosInsuficientes(musculo, len(ejercicios))
+                resultados[musculo] = ejercicios
+    finally:
+        # Las que aún no arrancaron no llegan a salir a la red
+        for f in pendientes:
+            f.cancel()
 
-        # Normalizar músculo solicitado
-        target_muscle = normalize_text(muscle_group)
+    return resultados
 
-        filtered = []
-        for i in items:
-            mg = normalize_text(
-                i.get("muscle_group") or i.get("muscle_group_display")
-            )
 
-            if mg == target_muscle:
-                filtered.append(i)
+# Versiones async (endpoint de generación sobre ASGI)
+_carga_catalogo_async = AsyncSingleFlight()
+
 
-        # Filtrar por dificultad si se pidió
-        if difficulty:
-            target_diff = normalize_text(difficulty)
-            filtered = [
-                i for i in filtered
-                if normalize_text(i.get("difficulty") or i.get("difficulty_display"))
-                   == target_diff
-            ]
+async def _acatalogo(muscle_group, difficulty, token=None):
+    """
+    exercise_catalog.get sin bloquear el event loop: con caché compartida la
+    lectura sale a la red y se hace en un hilo.
+    """
+    if exercise_catalog.shared_cache is None:
+        return exercise_catalog.get(muscle_group, difficulty, token)
+    return await sync_to_async(exercise_catalog.get, thread_sensitive=False)(muscle_group, difficulty, token)
 
-        return filtered
 
+async def _acargar_catalogo(token, timeout):
+    """
+    Descarga /exercises/all/ y lo indexa; el JSON se decodifica e indexa en
+    un hilo para no frenar el event loop. Una caída se anota en el catálogo.
+    """
+    try:
+        res = await exercises_async_client().get("exercises/all/", token, timeout=timeout)
+        if res.status_code == 200:
+            await sync_to_async(lambda: exercise_catalog.indexar(res.json()), thread_sensitive=False)()
+            return
     except Exception:
+        pass
+    exercise_catalog.registrar_fallo()
+
+
+async def afetch_exercises_by_muscle(muscle_group, difficulty, token, deadline=None, minimo=5):
+    with etapa("ejercicios", muscle=muscle_group) as e:
+        cached = await _acatalogo(normalize_text(muscle_group), normalize_text(difficulty), token)
+        if cached and len(cached) >= minimo:
+            e["source"] = "catalogo"
+            return cached
+
+        e["source"] = "fallback"
+        try:
+            res = await exercises_async_client().get(
+                "exercises/muscle-group/",
+                token,
+                params={"muscle_group": muscle_group},
+                timeout=_timeout_restante(deadline)
+            )
+            if res.status_code == 200:
+                return res.json()
+        except CircuitoAbierto:
+            raise
+        except Exception:
+            pass
+
+        e["source"] = "sin_datos"
         return []
 
-    return []
\ No newline at end of file
+
+async def afetch_exercises_for_split(split, difficulty, token, minimo=5, deadline_seconds=None):
+    """
+    Versión async de fetch_exercises_for_split: mismas reglas de presupuesto
+    y cancelación, pero con corrutinas en lugar de hilos.
+    """
+    if deadline_seconds is None:
+        deadline_seconds = getattr(settings, "EXERCISES_FETCH_DEADLINE", 60)
+    deadline = time.monotonic() + deadline_seconds
+
+    musculos = list(dict.fromkeys(split.values()))
+
+    # Si al catálogo le falta algún músculo se descarga una vez para todos,
+    # salvo que ya esté vigente o acabe de fallar (mismas reglas que ensure_loaded)
+    target_diff = normalize_text(difficulty)
+    if not exercise_catalog.vigente() and not exercise_catalog.fallo_reciente():
+        faltantes = [await _acatalogo(normalize_text(m), target_diff) is None for m in musculos]
+        if any(faltantes):
+            with etapa("catalogo"):
+                # Las peticiones concurrentes esperan a la misma descarga
+                await _carga_catalogo_async.do(
+                    "catalogo", lambda: _acargar_catalogo(token, _timeout_restante(deadline))
+                )
+
+    tareas = {
+        asyncio.ensure_future(afetch_exercises_by_muscle(m, difficulty, token, deadline, minimo)): m
+        for m in musculos
+    }
+
+    resultados = {}
+    pendientes = set(tareas)
+    try:
+        while pendientes:
+            restante = deadline - time.monotonic()
+            if restante <= 0:
+                raise TiempoAgotadoEjercicios(sorted(tareas[t] for t in pendientes))
+
+            listas, pendientes = await asyncio.wait(
+                pendientes, timeout=restante, return_when=asyncio.FIRST_COMPLETED
+            )
+            for t in listas:
+                musculo = tareas[t]
+                ejercicios = t.result()
+                if len(ejercicios) < minimo:
+                    raise EjerciciosInsuficientes(musculo, len(ejercicios))
+                resultados[musculo] = ejercicios
+    finally:
+        for t in pendientes:
+            t.cancel()
+
+    return resultados
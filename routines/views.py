@@ -1,127 +1,150 @@
-import random
+import logging
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.conf import settings
-from .models import Rutina, DiaRutina, DiaEjercicio
-from .serializers import RutinaSerializer
+from .authentication import MicroserviceJWTAuthentication
+from .models import Rutina, RutinaJob
+from .serializers import RutinaSerializer, RutinaResumenSerializer, RutinaJobSerializer, GenerarLoteSerializer
+from .permissions import IsBatchOperator
+from .pagination import RutinaCursorPagination
+from .cache import obtener_rutina_activa, invalidar_perfil
+from .clients import CircuitoAbierto
+from .services import generar_rutina_compartida, agenerar_rutina_compartida, generar_rutinas_lote
+from .idempotency import clave_valida, con_idempotencia, acon_idempotencia
+from .jobs import encolar_generacion
+from .snapshots import obtener_snapshot, respuesta_snapshot
+from .metrics import render_metricas
 from .utils import (
-    calcular_duracion_total,
-    calcular_series_reps_rest,
-    fetch_exercises_by_muscle
+    EjerciciosInsuficientes,
+    PerfilNoDisponible,
+    TiempoAgotadoEjercicios,
+)
+
+logger = logging.getLogger(__name__)
+
+# Errores esperados de la generación y el status HTTP con que se reportan
+STATUS_ERRORES_GENERACION = (
+    (EjerciciosInsuficientes, 400),
+    (PerfilNoDisponible, 502),
+    (CircuitoAbierto, 503),
+    (TiempoAgotadoEjercicios, 504),
 )
-import requests
-
-DEFAULT_SPLIT = {
-    "lunes": "pierna",
-    "martes": "pecho",
-    "miercoles": "espalda",
-    "jueves": "brazos",
-    "viernes": "cuerpo_completo"
-}
-
-NOMBRES_RUTINA_DIA = {
-    "pierna": [
-        "Piernas de Acero",
-        "Fuerza Inferior",
-    ],
-    "pecho": [
-        "Empuje Superior",
-        "Tono y Volumen"
-    ],
-    "espalda": [
-        "Espalda Definida",
-        "Fortaleza Dorsal"
-    ],
-    "brazos": [
-        "Brazos de Acero",
-        "Esculpe tus Brazos"
-    ],
-    "cuerpo_completo": [
-        "Entrenamiento Total",
-        "Cuerpo Completo",
-    ]
-}
+
+
+def status_error_generacion(error):
+    for clase, status in STATUS_ERRORES_GENERACION:
+        if isinstance(error, clase):
+            return status
+    logger.error("Error inesperado generando la rutina", exc_info=error)
+    return 500
+
+
+def cabeceras_generacion(status, cuerpo, repetida):
+    """
+    Cabeceras de una respuesta de /routines/generate/, también cuando se
+    repite desde un Idempotency-Key (solo se guardan status y cuerpo).
+    """
+    cabeceras = {}
+    if status == 202 and "job_id" in cuerpo:
+        cabeceras["Location"] = reverse("estado_job", args=[cuerpo["job_id"]])
+    elif status == 409:
+        cabeceras["Retry-After"] = "1"
+    if repetida:
+        cabeceras["Idempotent-Replayed"] = "true"
+    return cabeceras
 
 
 class GenerateRoutineView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        token = request.headers.get("Authorization")
+        if token and token.startswith("Bearer "):
+            token = token.split(" ")[1]
+
+        clave = request.headers.get("Idempotency-Key")
+        if clave is not None and not clave_valida(clave):
+            return Response({"error": "Idempotency-Key inválido"}, status=400)
+
+        status, cuerpo, repetida = con_idempotencia(
+            request.user.id, clave, lambda: self.generar(request, token)
+        )
+        return Response(cuerpo, status=status, headers=cabeceras_generacion(status, cuerpo, repetida))
+
+    def generar(self, request, token):
+        # ?mode=job: se encola y se responde de inmediato con el id del job
         try:
-            print("\n===== GENERANDO RUTINA =====")
-
-            token = request.headers.get("Authorization")
-            if token and token.startswith("Bearer "):
-                token = token.split(" ")[1]
-
-            # 1. Obtener perfil desde MS Usuarios
-            profile_res = requests.get(
-                f"{settings.USERS_SERVICE_URL}users/profile/",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-
-            print("PROFILE STATUS:", profile_res.status_code)
-            print("PROFILE JSON:", profile_res.json())
-
-            profile = profile_res.json()["user"]
-            difficulty = profile["experience"]
-            goal = profile["goal"]
-
-            print("EXPERIENCIA:", difficulty)
-            print("OBJETIVO:", goal)
-
-            # 2. Crear la rutina
-            total_duration = calcular_duracion_total(difficulty)
-            rutina = Rutina.objects.create(
-                user_id=request.user.id,
-                duracion_minutos=total_duration
-            )
-
-            # 3. Crear los días
-            for dia_nombre, musculo in DEFAULT_SPLIT.items():
-                ejercicios = fetch_exercises_by_muscle(musculo, difficulty, token)
-
-                if len(ejercicios) < 5:
-                    return Response(
-                        {"error": f"No hay suficientes ejercicios para {musculo}. Se recibieron {len(ejercicios)}"},
-                        status=400
-                    )
-
-                # Mezclar
-                random.shuffle(ejercicios)
-                ejercicios = ejercicios[:5]
-                nombre_dia = random.choice(NOMBRES_RUTINA_DIA.get(musculo, ["Día de Entrenamiento"]))
-
-                dia = DiaRutina.objects.create(
-                    rutina=rutina,
-                    dia=dia_nombre,
-                    musculo=musculo,
-                    nombre=nombre_dia,
-                )
-
-                series, reps, rest = calcular_series_reps_rest(goal, difficulty)
-
-                for ex in ejercicios:
-                    DiaEjercicio.objects.create(
-                        dia=dia,
-                        ejercicio_id=ex["id"],
-                        name=ex["name"],
-                        muscle_group=ex["muscle_group_display"],
-                        difficulty=ex["difficulty_display"],
-                        equipment=ex["equipment_display"],
-                        image_url=ex["image_url"],
-                        series=series,
-                        reps=reps,
-                        rest_seconds=rest
-                    )
-
-            return Response({"message": "Rutina generada correctamente", "rutina_id": str(rutina.id)})
+            if request.query_params.get("mode") == "job":
+                job = encolar_generacion(request.user.id, token)
+                return 202, {"job_id": str(job.id), "estado": job.estado}
 
+            rutina = generar_rutina_compartida(request.user.id, token)
         except Exception as e:
-            print("\nERROR EN LA RUTINA")
-            print("Detalle:", e)
-            return Response({"error": str(e)}, status=500)
+            return status_error_generacion(e), {"error": str(e)}
+
+        return 200, {"message": "Rutina generada correctamente", "rutina_id": str(rutina.id)}
+
+
+class GenerateRoutineBatchView(APIView):
+    """
+    Genera rutinas para muchos usuarios en una sola llamada (p. ej. una
+    cohorte tras un cambio de programa). Reservado a operadores.
+    """
+    permission_classes = [IsBatchOperator]
+
+    def post(self, request):
+        serializer = GenerarLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        token = request.headers.get("Authorization")
+        if token and token.startswith("Bearer "):
+            token = token.split(" ")[1]
+
+        creadas, errores = generar_rutinas_lote(serializer.validated_data["profiles"], token)
+        return Response({
+            "creadas": [{"user_id": u, "rutina_id": str(r.id)} for u, r in creadas],
+            "errores": [{"user_id": u, "error": e} for u, e in errores],
+        })
+
+
+@csrf_exempt
+@require_POST
+async def generar_rutina_async(request):
+    """
+    Variante async de GenerateRoutineView para servir bajo ASGI: mientras
+    espera a los MS de Usuarios y Ejercicios no ocupa un worker.
+    DRF no soporta vistas async, así que la autenticación JWT se hace aquí.
+    """
+    autenticacion = MicroserviceJWTAuthentication()
+    try:
+        autenticado = autenticacion.authenticate(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=401)
+    if autenticado is None:
+        return JsonResponse({"detail": "No se proporcionaron credenciales de autenticación."}, status=401)
+
+    user, _ = autenticado
+    token = autenticacion.get_raw_token(autenticacion.get_header(request)).decode()
+
+    clave = request.headers.get("Idempotency-Key")
+    if clave is not None and not clave_valida(clave):
+        return JsonResponse({"error": "Idempotency-Key inválido"}, status=400)
+
+    async def generar():
+        try:
+            rutina = await agenerar_rutina_compartida(user.id, token)
+        except Exception as e:
+            return status_error_generacion(e), {"error": str(e)}
+        return 200, {"message": "Rutina generada correctamente", "rutina_id": str(rutina.id)}
+
+    status, cuerpo, repetida = await acon_idempotencia(user.id, clave, generar)
+    return JsonResponse(cuerpo, status=status, headers=cabeceras_generacion(status, cuerpo, repetida))
 
 
 class ListRutinasView(APIView):
@@ -129,8 +152,23 @@ class ListRutinasView(APIView):
 
     def get(self, request):
         user_id = int(request.user.id)
-        rutinas = Rutina.objects.filter(user_id=user_id).order_by("-created_at")
-        data = RutinaSerializer(rutinas, many=True).data
+        rutinas = Rutina.objects.filter(user_id=user_id).order_by("-created_at", "-id")
+
+        # ?fields=summary: solo columnas de Rutina, sin días ni ejercicios
+        if request.query_params.get("fields") == "summary":
+            rutinas = rutinas.only("id", "created_at", "duracion_minutos")
+            serializer_class = RutinaResumenSerializer
+        else:
+            rutinas = rutinas.con_detalles()
+            serializer_class = RutinaSerializer
+
+        paginator = RutinaCursorPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(rutinas, request, view=self)
+            data = serializer_class(page, many=True).data
+            return paginator.get_paginated_response(data)
+
+        data = serializer_class(rutinas, many=True).data
         return Response(data)
 
 
@@ -138,12 +176,11 @@ class GetRutinaView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, rutina_id):
-        user_id = int(request.user.id)
-        try:
-            rutina = Rutina.objects.get(id=rutina_id, user_id=user_id)
-        except Rutina.DoesNotExist:
+        snapshot = obtener_snapshot(rutina_id, int(request.user.id), "detalle")
+        if snapshot is None:
             return Response({"detail": "Rutina no encontrada"}, status=404)
-        return Response(RutinaSerializer(rutina).data)
+        cuerpo, etag = snapshot
+        return respuesta_snapshot(request, cuerpo, f"{etag}-detalle")
 
 
 class CheckRoutineView(APIView):
@@ -151,35 +188,53 @@ class CheckRoutineView(APIView):
 
     def get(self, request):
         user_id = request.user.id
-        rutina = Rutina.objects.filter(user_id=user_id).order_by("-created_at").first()
 
-        if rutina:
-            return Response({"rutina_id": str(rutina.id)})
-        return Response({"rutina_id": None})
+        def cargar():
+            rutina = Rutina.objects.filter(user_id=user_id).order_by("-created_at").first()
+            return str(rutina.id) if rutina else None
+
+        return Response({"rutina_id": obtener_rutina_activa(user_id, cargar)})
 
 
 class GetRoutineByDays(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, rutina_id):
+        snapshot = obtener_snapshot(rutina_id, request.user.id, "por_dias")
+        if snapshot is None:
+            return Response({"error": "Rutina no encontrada"}, status=404)
+        cuerpo, etag = snapshot
+        return respuesta_snapshot(request, cuerpo, f"{etag}-dias")
+
+
+class InvalidateProfileCacheView(APIView):
+    """
+    Descarta el perfil cacheado del usuario del token. Lo llama el MS de
+    Usuarios (o la app) después de actualizar el perfil.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request):
+        invalidar_perfil(request.user.id)
+        return Response(status=204)
+
+
+class GetJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
         try:
-            rutina = Rutina.objects.get(id=rutina_id, user_id=request.user.id)
-            dias = {}
-            for dia in rutina.dias.all():
-                dias[dia.dia] = {
-                    "nombre": dia.nombre,
-                    "musculo": dia.musculo,
-                    "detalles": [
-                        {
-                            "ejercicio_id": ex.ejercicio_id,
-                            "name": ex.name,
-                            "image_url": ex.image_url,
-                            "series": ex.series,
-                            "reps": ex.reps,
-                            "rest_seconds": ex.rest_seconds
-                        } for ex in dia.detalles.all()
-                    ]
-                }
-            return Response({"id": str(rutina.id), "dias": dias})
-        except Rutina.DoesNotExist:
-            return Response({"error": "Rutina no encontrada"}, status=404)
\ No newline at end of file
+            job = RutinaJob.objects.get(id=job_id, user_id=request.user.id)
+        except RutinaJob.DoesNotExist:
+            return Response({"detail": "Job no encontrado"}, status=404)
+        return Response(RutinaJobSerializer(job).data)
+
+
+def metrics(request):
+    """
+    Métricas del proceso en formato de texto de Prometheus. Solo se sirven
+    a las IPs de METRICS_ALLOWED_IPS.
+    """
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponse(status=403)
+    return HttpResponse(render_metricas(), content_type="text/plain; version=0.0.4; charset=utf-8")